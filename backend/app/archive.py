@@ -0,0 +1,137 @@
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+from collections import namedtuple
+from datetime import date
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from . import crud, models, partitions
+from .database import SessionLocal
+from .events import broker
+from .logs import log_manager
+
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "12"))
+ARCHIVE_COMPRESSION_LEVEL = 9
+ARCHIVED_EVENT = "attendance.archived"
+
+# Has every field exporters read from crud.iter_employees rows, so they take either.
+ArchivedRecord = namedtuple("ArchivedRecord", ("id", "full_name", "status", "date", "note"))
+
+
+def _encode(rows: Iterable[Sequence]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for employee_id, full_name, status, day, note in rows:
+        writer.writerow([employee_id, full_name, int(bool(status)), day.isoformat(), "" if note is None else note])
+    return gzip.compress(buffer.getvalue().encode(), compresslevel=ARCHIVE_COMPRESSION_LEVEL)
+
+
+def _decode(payload: bytes) -> Iterator[ArchivedRecord]:
+    for employee_id, full_name, status, day, note in csv.reader(io.StringIO(gzip.decompress(payload).decode())):
+        yield ArchivedRecord(int(employee_id), full_name, status == "1", date.fromisoformat(day), note or None)
+
+
+def default_cutoff(today: Optional[date] = None) -> date:
+    return partitions.add_months(partitions.month_start(today or date.today()), -ARCHIVE_AFTER_MONTHS)
+
+
+def archive_before(db: Session, cutoff: date) -> List[Tuple[date, int]]:
+    cutoff = partitions.month_start(cutoff)
+    current = crud.get_archived_before(db)
+    if current is not None and cutoff <= current:
+        return []
+    # The bump locks the version row first: writers queue behind it and then see the new boundary.
+    version = crud.bump_data_version(db)
+    # Archived rows leave the change feed without tombstones, so every synced client has to reload.
+    db.execute(
+        update(models.DataVersion)
+        .where(models.DataVersion.id == crud.DATA_VERSION_ID)
+        .values(purged_version=version, archived_before=cutoff)
+    )
+    first = db.execute(select(func.min(models.Employee.date)).where(models.Employee.date < cutoff)).scalar()
+    archived: List[Tuple[date, int]] = []
+    for month in partitions.months(first, partitions.add_months(cutoff, -1)) if first else ():
+        end = partitions.add_months(month, 1)
+        rows = db.execute(
+            select(*crud.EMPLOYEE_COLUMNS)
+            .join_from(models.Employee, models.Person)
+            .where(models.Employee.deleted_at.is_(None), models.Employee.date >= month, models.Employee.date < end)
+            .order_by(models.Employee.date.desc(), models.Person.full_name.asc())
+        ).all()
+        if rows:
+            db.add(models.AttendanceArchive(month=month, rows=len(rows), payload=_encode(rows)))
+            archived.append((month, len(rows)))
+        partitions.drop_partition(db.connection(), month)
+    # Tombstones and anything outside a dropped partition.
+    db.execute(delete(models.Employee).where(models.Employee.date < cutoff))
+    broker.publish(db, ARCHIVED_EVENT, {"version": version, "before": cutoff.isoformat()})
+    db.commit()
+    total = sum(count for _, count in archived)
+    log_manager.add("INFO", f"Archived {total} attendance records in {len(archived)} months before {cutoff}")
+    return archived
+
+
+def iter_archived(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[ArchivedRecord]:
+    query = select(models.AttendanceArchive.payload).order_by(models.AttendanceArchive.month.desc())
+    if start:
+        query = query.where(models.AttendanceArchive.month >= partitions.month_start(start))
+    if end:
+        query = query.where(models.AttendanceArchive.month <= end)
+    # One month is decompressed at a time.
+    for payload in db.scalars(query):
+        for record in _decode(payload):
+            if (start is None or record.date >= start) and (end is None or record.date <= end):
+                yield record
+
+
+def iter_employees(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Iterator:
+    # Export rows: live records first, then archived months, both newest first.
+    yield from crud.iter_employees(db, start, end)
+    archived_before = crud.get_archived_before(db)
+    if archived_before is not None and (start is None or start < archived_before):
+        yield from iter_archived(db, start, end)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.archive", description="Архив закрытых месяцев посещаемости")
+    parser.add_argument("command", nargs="?", choices=("run", "status"), default="status")
+    parser.add_argument(
+        "--before",
+        type=date.fromisoformat,
+        help=f"Архивировать месяцы до этой даты (по умолчанию старше {ARCHIVE_AFTER_MONTHS} мес.)",
+    )
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "run":
+            archived = archive_before(db, args.before or default_cutoff())
+            for month, count in archived:
+                print(f"{month:%Y-%m}: {count} records archived")
+            if not archived:
+                print("Nothing to archive")
+        else:
+            print(f"Archived before: {crud.get_archived_before(db) or '-'}")
+            months = db.execute(
+                select(
+                    models.AttendanceArchive.month,
+                    models.AttendanceArchive.rows,
+                    func.length(models.AttendanceArchive.payload),
+                ).order_by(models.AttendanceArchive.month)
+            )
+            for month, count, size in months:
+                print(f"{month:%Y-%m}: {count} records, {size} bytes")
+    finally:
+        db.close()
+    log_manager.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
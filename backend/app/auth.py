@@ -1,22 +1,138 @@
+import asyncio
+import math
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Optional, Tuple
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from . import models
-from .database import get_db
+from .database import get_session, run_db
+from .events import broker
 from .logs import log_manager
 
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key-change")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+CREDENTIALS_EVENT = "user.credentials"
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20"))
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+LIMITER_SWEEP_SIZE = 10000
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    token_version: int
+
+
+class PrincipalCache:
+    def __init__(self, size: int, ttl: float) -> None:
+        self._size = size
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return entry[0]
+
+    def put(self, principal: Principal) -> None:
+        with self._lock:
+            self._entries[principal.username] = (principal, time.monotonic() + self._ttl)
+            self._entries.move_to_end(principal.username)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def discard(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+class LoginRateLimiter:
+    def __init__(self, max_failures: int, max_failures_per_ip: int, window_seconds: int) -> None:
+        self._limits = {"user": max_failures, "ip": max_failures_per_ip}
+        self._window = window_seconds
+        self._failures: Dict[Tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, username: str, client: str) -> Tuple[Tuple[str, str], Tuple[str, str]]:
+        return ("user", f"{username.strip().lower()}|{client}"), ("ip", client)
+
+    def retry_after(self, username: str, client: str) -> int:
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for key in self._keys(username, client):
+                failures = self._prune(key, now)
+                if failures is not None and len(failures) >= self._limits[key[0]]:
+                    wait = max(wait, failures[0] + self._window - now)
+        return math.ceil(wait)
+
+    def record_failure(self, username: str, client: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) >= LIMITER_SWEEP_SIZE:
+                for stale in list(self._failures):
+                    self._prune(stale, now)
+            for key in self._keys(username, client):
+                self._failures.setdefault(key, deque()).append(now)
+
+    def reset(self, username: str, client: str) -> None:
+        with self._lock:
+            self._failures.pop(self._keys(username, client)[0], None)
+
+    def _prune(self, key: Tuple[str, str], now: float) -> Optional[Deque[float]]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] + self._window <= now:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+
+login_limiter = LoginRateLimiter(LOGIN_MAX_FAILURES, LOGIN_MAX_FAILURES_PER_IP, LOGIN_WINDOW_SECONDS)
+
+# bcrypt costs 100+ ms of CPU; a small dedicated pool keeps login bursts off the request threadpool.
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -40,8 +156,12 @@ def is_password_hash_usable(hashed_password: str | None) -> bool:
         return False
 
 
+def _find_user(db: Session, username: str) -> models.User | None:
+    return db.query(models.User).filter(models.User.username == username).first()
+
+
 def authenticate_user(db: Session, username: str, password: str) -> models.User | None:
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = _find_user(db, username)
     if not user:
         return None
     if not verify_password(password, user.password_hash):
@@ -49,6 +169,29 @@ def authenticate_user(db: Session, username: str, password: str) -> models.User
     return user
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер занят, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+    finally:
+        _hash_slots.release()
+
+
+async def authenticate_user_async(db: Session | AsyncSession, username: str, password: str) -> models.User | None:
+    user = await run_db(db, _find_user, username)
+    if not user:
+        return None
+    if not await verify_password_async(password, user.password_hash):
+        return None
+    return user
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -57,12 +200,18 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return token
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
+def create_user_token(user: models.User) -> str:
+    return create_access_token({"sub": user.username, "tv": user.token_version})
+
+
+async def _user_from_token(db: Session | AsyncSession, token: str | None) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str | None = payload.get("sub")
@@ -71,7 +220,46 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
     except jwt.PyJWTError as exc:
         log_manager.add("ERROR", f"Authentication failed: {exc}")
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
+    # Tokens issued before token versions existed carry no "tv" and stay valid until credentials change.
+    token_version = payload.get("tv", 0)
+    principal = principal_cache.get(username)
+    if principal is None or principal.token_version < token_version:
+        principal = await run_db(db, _load_principal, username)
+        if principal is None:
+            raise credentials_exception
+        principal_cache.put(principal)
+    if principal.token_version != token_version:
         raise credentials_exception
-    return user
+    return principal
+
+
+def _load_principal(db: Session, username: str) -> Optional[Principal]:
+    user = _find_user(db, username)
+    if user is None:
+        return None
+    return Principal(id=user.id, username=user.username, token_version=user.token_version)
+
+
+def _on_event(message: Dict[str, Any]) -> None:
+    if message.get("type") == CREDENTIALS_EVENT:
+        for username in message.get("usernames", []):
+            principal_cache.discard(username)
+    elif message.get("type") == "resync":
+        principal_cache.clear()
+
+
+broker.add_callback(_on_event)
+
+
+async def get_current_user(
+    db: Session | AsyncSession = Depends(get_session), token: str = Depends(oauth2_scheme)
+) -> Principal:
+    return await _user_from_token(db, token)
+
+
+async def get_stream_user(
+    db: Session | AsyncSession = Depends(get_session),
+    header_token: str | None = Depends(optional_oauth2_scheme),
+    token: str | None = Query(None, description="JWT для клиентов без заголовков (EventSource)"),
+) -> Principal:
+    return await _user_from_token(db, header_token or token)
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from . import crud, migrations, partitions
+from .database import SessionLocal, advisory_lock
+from .logs import log_manager
+
+BOOTSTRAP_LOCK_KEY = 7_310_001
+# Deployments that run `python -m app.bootstrap` before starting the workers switch this off.
+BOOTSTRAP_ON_STARTUP = os.getenv("BOOTSTRAP_ON_STARTUP", "true").lower() in {"1", "true", "yes"}
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.phases: List[Tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def summary(self) -> str:
+        total = sum(seconds for _, seconds in self.phases)
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases)
+        return f"{total * 1000:.0f} ms ({parts})"
+
+
+def process_age() -> Optional[float]:
+    # Seconds since this process was started, from /proc; None where procfs is unavailable.
+    try:
+        with open("/proc/self/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as uptime:
+            booted = float(uptime.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    # starttime is field 22 of stat, counted in clock ticks since boot; fields[0] here is field 3.
+    return max(0.0, booted - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+
+
+def run(timings: Optional[Timings] = None) -> None:
+    timings = timings or Timings()
+    # Several workers or replicas may start at once; the lock makes schema and seed setup run one at a time.
+    with advisory_lock(BOOTSTRAP_LOCK_KEY):
+        with timings.phase("migrations"):
+            migrations.upgrade()
+        with timings.phase("seed"):
+            db = SessionLocal()
+            try:
+                crud.ensure_default_user(db)
+                crud.ensure_settings(db)
+                crud.ensure_data_version(db)
+                crud.ensure_daily_totals(db)
+                partitions.ensure_partitions(db)
+            finally:
+                db.close()
+
+
+def main() -> int:
+    timings = Timings()
+    run(timings)
+    log_manager.add("INFO", f"Bootstrap finished in {timings.summary()}")
+    log_manager.flush()
+    print(f"Bootstrap finished in {timings.summary()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,53 @@
-from datetime import date
-from typing import List, Optional, Tuple
+import csv
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from datetime import date, datetime, timedelta
+from io import StringIO
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from sqlalchemy import func
+from sqlalchemy import and_, case, delete, event, func, insert, literal, literal_column, or_, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 
-from . import models, schemas
-from .auth import get_password_hash, is_password_hash_usable
+from . import models, pagination, schemas
+from .database import ReadSessionLocal, SessionLocal, engine
+from .auth import CREDENTIALS_EVENT, get_password_hash, is_password_hash_usable
+from .events import broker
 
 
 DEFAULT_USERNAME = "admin"
 DEFAULT_PASSWORD = "admin"
+STREAM_BATCH_SIZE = 2000
+UPSERT_LOOKUP_CHUNK = 400
+DAILY_REFRESH_CHUNK = 500
+DATA_VERSION_ID = 1
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+WEBHOOK_QUEUE_RETENTION_HOURS = int(os.getenv("WEBHOOK_QUEUE_RETENTION_HOURS", "24"))
+# Advisory lock classes for the webhook queue: updates/deletes lock the record id, adds the (name, date) key.
+WEBHOOK_RECORD_LOCK_CLASS = 7_310_101
+WEBHOOK_ADD_LOCK_CLASS = 7_310_102
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))
+SETTINGS_EVENT = "settings.updated"
+_SETTINGS_CHANGED_KEY = "settings_changed"
 from .logs import log_manager
 
+# Plain column tuples for list endpoints: no identity map, no ORM instances to hydrate.
+# Names live in the people directory; queries selecting them go through _with_names.
+EMPLOYEE_COLUMNS = (
+    models.Employee.id,
+    models.Person.full_name,
+    models.Employee.status,
+    models.Employee.date,
+    models.Employee.note,
+)
+
 
 def ensure_default_user(db: Session) -> None:
     user = db.query(models.User).filter(models.User.username == DEFAULT_USERNAME).first()
@@ -42,52 +78,587 @@ def ensure_settings(db: Session) -> models.Settings:
     return settings
 
 
-def list_employees(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[List[models.Employee], float]:
-    query = db.query(models.Employee)
+_settings_lock = threading.Lock()
+_settings_cache: Optional[Tuple[schemas.SettingsResponse, float]] = None
+_settings_generation = 0
+
+
+def get_settings(db: Session) -> schemas.SettingsResponse:
+    global _settings_cache
+    with _settings_lock:
+        cached, generation = _settings_cache, _settings_generation
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    # The cache is shared by every route, so a miss must not be filled from a replica that lags behind the update.
+    primary = db if db.get_bind() is engine else SessionLocal()
+    try:
+        settings = ensure_settings(primary)
+        snapshot = schemas.SettingsResponse(lunch_price=settings.lunch_price, updated_at=settings.updated_at)
+    finally:
+        if primary is not db:
+            primary.close()
+    with _settings_lock:
+        # An invalidation that arrived while we were reading means the row may already be stale.
+        if generation == _settings_generation:
+            _settings_cache = (snapshot, time.monotonic() + SETTINGS_CACHE_TTL)
+    return snapshot
+
+
+def invalidate_settings() -> None:
+    global _settings_cache, _settings_generation
+    with _settings_lock:
+        _settings_cache = None
+        _settings_generation += 1
+
+
+def _on_event(message: Dict) -> None:
+    if message.get("type") in (SETTINGS_EVENT, "resync"):
+        invalidate_settings()
+
+
+broker.add_callback(_on_event)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_settings(session: Session) -> None:
+    # On PostgreSQL our own NOTIFY arrives asynchronously; the writer must not serve its stale cache until then.
+    if session.info.pop(_SETTINGS_CHANGED_KEY, False):
+        invalidate_settings()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_settings_change(session: Session) -> None:
+    session.info.pop(_SETTINGS_CHANGED_KEY, None)
+
+
+def ensure_data_version(db: Session) -> None:
+    if db.get(models.DataVersion, DATA_VERSION_ID) is None:
+        db.add(models.DataVersion(id=DATA_VERSION_ID, version=1))
+        db.commit()
+
+
+def get_data_version(db: Session) -> int:
+    return db.execute(
+        select(models.DataVersion.version).where(models.DataVersion.id == DATA_VERSION_ID)
+    ).scalar_one()
+
+
+def bump_data_version(db: Session, days: Iterable[Optional[date]] = ()) -> int:
+    # The bump locks the version row, so checking the archive boundary here cannot race with archiving.
+    version, archived_before = db.execute(
+        update(models.DataVersion)
+        .where(models.DataVersion.id == DATA_VERSION_ID)
+        .values(version=models.DataVersion.version + 1)
+        .returning(models.DataVersion.version, models.DataVersion.archived_before)
+    ).one()
+    if archived_before is not None and any(day is not None and day < archived_before for day in days):
+        raise ArchivedPeriodError(f"Records before {archived_before} are archived")
+    return version
+
+
+def get_archived_before(db: Session) -> Optional[date]:
+    return db.execute(
+        select(models.DataVersion.archived_before).where(models.DataVersion.id == DATA_VERSION_ID)
+    ).scalar_one()
+
+
+def open_read_session(min_version: int = 0) -> Session:
+    # A replica that has not replayed up to min_version yet would serve stale rows; use the primary instead.
+    db = ReadSessionLocal()
+    if min_version and get_data_version(db) < min_version:
+        db.close()
+        return SessionLocal()
+    return db
+
+
+def list_employees(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[List[Row], float]:
+    query = _filter_employees(_with_names(select(*EMPLOYEE_COLUMNS)), start, end)
+    employees = db.execute(query.order_by(models.Employee.date.desc(), models.Person.full_name.asc())).all()
+    lunch_price = get_settings(db).lunch_price
+    return employees, lunch_price
+
+
+def _with_names(query):
+    return query.join_from(models.Employee, models.Person, models.Employee.person_id == models.Person.id)
+
+
+def _filter_employees(
+    query,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    status: Optional[bool] = None,
+    name_prefix: Optional[str] = None,
+    note: Optional[str] = None,
+):
+    query = query.where(models.Employee.deleted_at.is_(None))
     if start:
-        query = query.filter(models.Employee.date >= start)
+        query = query.where(models.Employee.date >= start)
     if end:
-        query = query.filter(models.Employee.date <= end)
-    employees = query.order_by(models.Employee.date.desc(), models.Employee.full_name.asc()).all()
-    lunch_price = ensure_settings(db).lunch_price
-    return employees, lunch_price
+        query = query.where(models.Employee.date <= end)
+    if status is not None:
+        query = query.where(models.Employee.status.is_(status))
+    if name_prefix:
+        # Matching names are resolved in the small people table, then filtered by integer id.
+        people = select(models.Person.id).where(models.Person.full_name.startswith(name_prefix, autoescape=True))
+        query = query.where(models.Employee.person_id.in_(people))
+    if note:
+        query = query.where(models.Employee.note.contains(note, autoescape=True))
+    return query
 
 
-def create_employee(db: Session, employee: schemas.EmployeeCreate) -> models.Employee:
-    db_employee = models.Employee(**employee.dict())
-    db.add(db_employee)
-    db.commit()
-    db.refresh(db_employee)
-    log_manager.add("INFO", f"Added employee {db_employee.full_name} for {db_employee.date}")
-    return db_employee
+def page_employees(
+    db: Session,
+    sort: str = pagination.DEFAULT_SORT,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    **filters,
+) -> Tuple[List[Row], Optional[str], Optional[Tuple[int, int]]]:
+    keys = pagination.EMPLOYEE_SORTS[sort]
+    # Totals describe the whole filtered set, not a page, so only the first page pays for them.
+    totals = None
+    if not cursor:
+        participating = func.coalesce(func.sum(case((models.Employee.status.is_(True), 1), else_=0)), 0)
+        count_query = select(func.count(models.Employee.id), participating)
+        totals = tuple(db.execute(_filter_employees(count_query, **filters)).one())
+    query = _filter_employees(_with_names(select(*EMPLOYEE_COLUMNS)), **filters)
+    if cursor:
+        query = query.where(pagination.after(keys, pagination.decode_cursor(sort, cursor, keys)))
+    rows = db.execute(query.order_by(*pagination.order_by(keys)).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_cursor(sort, pagination.row_values(keys, rows[-1]))
+    return rows, next_cursor, totals
+
+
+def iter_employees(
+    db: Session, start: Optional[date] = None, end: Optional[date] = None, batch_size: int = STREAM_BATCH_SIZE
+) -> Iterator[Row]:
+    query = _filter_employees(
+        _with_names(select(models.Employee.id, models.Person.full_name, models.Employee.status, models.Employee.date)),
+        start,
+        end,
+    )
+    query = query.order_by(models.Employee.date.desc(), models.Person.full_name.asc())
+    yield from db.execute(query.execution_options(yield_per=batch_size))
+
+
+def list_people(db: Session, name_prefix: Optional[str] = None) -> List[Row]:
+    query = select(models.Person.id, models.Person.full_name)
+    if name_prefix:
+        query = query.where(models.Person.full_name.startswith(name_prefix, autoescape=True))
+    return db.execute(query.order_by(models.Person.full_name.asc())).all()
+
+
+def get_person(db: Session, person_id: int) -> Optional[models.Person]:
+    return db.get(models.Person, person_id)
+
+
+def person_history(
+    db: Session, person_id: int, start: Optional[date] = None, end: Optional[date] = None
+) -> List[Row]:
+    # Served by the (person_id, date) key index: no name comparison, no scan over other people.
+    query = _filter_employees(
+        select(models.Employee.id, models.Employee.date, models.Employee.status, models.Employee.note), start, end
+    )
+    query = query.where(models.Employee.person_id == person_id)
+    return db.execute(query.order_by(models.Employee.date.desc())).all()
+
+
+class DuplicateEmployeeError(ValueError):
+    pass
 
 
-def update_employee(db: Session, employee_id: int, payload: schemas.EmployeeUpdate) -> models.Employee:
-    db_employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
+class ArchivedPeriodError(ValueError):
+    pass
+
+
+class IdempotencyKeyReusedError(ValueError):
+    pass
+
+
+def person_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    # Resolves names to directory ids, adding the ones seen for the first time.
+    wanted = sorted(set(names))
+    ids: Dict[str, int] = {}
+    for offset in range(0, len(wanted), UPSERT_LOOKUP_CHUNK):
+        chunk = wanted[offset : offset + UPSERT_LOOKUP_CHUNK]
+        lookup = select(models.Person.full_name, models.Person.id)
+        ids.update(db.execute(lookup.where(models.Person.full_name.in_(chunk))).all())
+        missing = [name for name in chunk if name not in ids]
+        if not missing:
+            continue
+        now = datetime.utcnow()
+        stmt = _dialect_insert(db, models.Person.__table__).values(
+            [{"full_name": name, "created_at": now} for name in missing]
+        )
+        stmt = stmt.on_conflict_do_nothing(index_elements=[models.Person.full_name])
+        ids.update(db.execute(stmt.returning(models.Person.full_name, models.Person.id)).all())
+        # Names a concurrent writer added first come back without RETURNING rows; read their ids.
+        raced = [name for name in missing if name not in ids]
+        if raced:
+            ids.update(db.execute(lookup.where(models.Person.full_name.in_(raced))).all())
+    return ids
+
+
+def _person(db: Session, full_name: str) -> models.Person:
+    lookup = select(models.Person).where(models.Person.full_name == full_name)
+    person = db.scalars(lookup).first()
+    if person is not None:
+        return person
+    stmt = _dialect_insert(db, models.Person).values(full_name=full_name, created_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_nothing(index_elements=[models.Person.full_name]).returning(models.Person)
+    person = db.scalars(stmt).first()
+    # No row back means a concurrent writer added the name first.
+    return person if person is not None else db.scalars(lookup).one()
+
+
+def _upsert_statement(db: Session, target=models.Employee.__table__):
+    # (person_id, date) is the natural key; a write for an existing key, even a deleted one, overwrites it.
+    # Core table by default: ORM bulk INSERT ... RETURNING re-sorts every returned row.
+    # Single-row upserts pass the mapped class to get the record back as an entity.
+    stmt = _dialect_insert(db, target)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.Employee.person_id, models.Employee.date],
+        set_={
+            "status": stmt.excluded.status,
+            "note": stmt.excluded.note,
+            "version": stmt.excluded.version,
+            "updated_at": stmt.excluded.updated_at,
+            "deleted_at": None,
+        },
+    )
+
+
+def _dedupe(rows: Sequence[Dict]) -> List[Dict]:
+    # ON CONFLICT cannot touch the same row twice in one statement; the last occurrence wins.
+    return list({(row["full_name"], row["date"]): row for row in rows}.values())
+
+
+def _existing_keys(db: Session, keys: Sequence[Tuple[int, date]]) -> set:
+    existing = set()
+    for offset in range(0, len(keys), UPSERT_LOOKUP_CHUNK):
+        chunk = keys[offset : offset + UPSERT_LOOKUP_CHUNK]
+        existing.update(
+            db.execute(
+                select(models.Employee.person_id, models.Employee.date).where(
+                    tuple_(models.Employee.person_id, models.Employee.date).in_(chunk)
+                )
+            ).all()
+        )
+    return existing
+
+
+def _upsert_one(db: Session, row: Dict) -> Tuple[models.Employee, bool, Optional[bool]]:
+    # Returns the row, whether it is new, and the previous status when a live row was overwritten.
+    # Callers bump the data version first, so concurrent writers already queue on the version row.
+    key = (models.Employee.person_id == row["person_id"], models.Employee.date == row["date"])
+    stmt = _upsert_statement(db, models.Employee).values(row)
+    options = {"populate_existing": True}
+    if db.bind.dialect.name == "postgresql":
+        # One statement: WITH sub-statements share the snapshot taken before the write, so the CTE holds the
+        # pre-image, and xmax = 0 tells a fresh insert from a conflict update.
+        previous = select(models.Employee.status).where(*key, models.Employee.deleted_at.is_(None)).cte("previous")
+        stmt = stmt.add_cte(previous).returning(
+            models.Employee, literal_column("xmax = 0"), select(previous.c.status).scalar_subquery()
+        )
+        db_employee, created, previous_status = db.execute(stmt, execution_options=options).one()
+        return db_employee, bool(created), previous_status
+    # SQLite evaluates RETURNING subqueries after the write, so the pre-image is read first; it is in-process.
+    before = db.execute(select(models.Employee.status, models.Employee.deleted_at).where(*key)).first()
+    db_employee = db.scalars(stmt.returning(models.Employee), execution_options=options).one()
+    previous_status = before.status if before is not None and before.deleted_at is None else None
+    return db_employee, before is None, previous_status
+
+
+def upsert_employee(
+    db: Session, employee: schemas.EmployeeCreate, commit: bool = True
+) -> Tuple[models.Employee, bool]:
+    version = bump_data_version(db, [employee.date])
+    values = employee.dict()
+    person = _person(db, values.pop("full_name"))
+    row = {**values, "person_id": person.id, "version": version, "updated_at": datetime.utcnow()}
+    db_employee, created, previous_status = _upsert_one(db, row)
+    previous = [(row["date"], previous_status)] if previous_status is not None else []
+    _apply_daily_deltas(db, _daily_deltas([(row["date"], row["status"])], previous))
+    _publish_employee(db, "employee.created" if created else "employee.updated", db_employee, version)
+    _finish_write(db, db_employee, commit)
+    action = "Added" if created else "Updated"
+    log_manager.add("INFO", f"{action} employee {db_employee.full_name} for {db_employee.date}")
+    return db_employee, created
+
+
+def create_employee(db: Session, employee: schemas.EmployeeCreate, commit: bool = True) -> models.Employee:
+    return upsert_employee(db, employee, commit)[0]
+
+
+def bulk_upsert_employees(db: Session, rows: Sequence[Dict]) -> Tuple[int, int]:
+    if not rows:
+        return 0, 0
+    version = bump_data_version(db, (row["date"] for row in rows))
+    now = datetime.utcnow()
+    unique = [{**row, "version": version, "updated_at": now} for row in _dedupe(rows)]
+    if db.bind.dialect.name == "postgresql":
+        created, updated = _copy_upsert_employees(db, unique)
+    else:
+        ids = person_ids(db, (row["full_name"] for row in unique))
+        records = [
+            {
+                "person_id": ids[row["full_name"]],
+                "status": row["status"],
+                "date": row["date"],
+                "note": row.get("note"),
+                "version": version,
+                "updated_at": now,
+            }
+            for row in unique
+        ]
+        existing = _existing_keys(db, [(record["person_id"], record["date"]) for record in records])
+        db.execute(_upsert_statement(db), records)
+        updated = len(existing)
+        created = len(records) - updated
+    # Repeated keys within the batch overwrote their earlier rows.
+    updated += len(rows) - len(unique)
+    refresh_daily_totals(db, {row["date"] for row in unique})
+    broker.publish(
+        db, "employees.imported", {"version": version, "count": len(rows), "created": created, "updated": updated}
+    )
+    return created, updated
+
+
+def _copy_upsert_employees(db: Session, rows: Sequence[Dict]) -> Tuple[int, int]:
+    # COPY into a session-local staging table, add unknown names to people, then one INSERT ... SELECT ... ON CONFLICT.
+    connection = db.connection()
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS attendance_incoming "
+        "(full_name varchar(255), status boolean, date date, note varchar(255), version bigint, updated_at timestamp) "
+        "ON COMMIT DELETE ROWS"
+    )
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [
+                row["full_name"],
+                row["status"],
+                row["date"].isoformat(),
+                row.get("note"),
+                row["version"],
+                row["updated_at"].isoformat(),
+            ]
+        )
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY attendance_incoming (full_name, status, date, note, version, updated_at) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+    connection.exec_driver_sql(
+        """
+        INSERT INTO people (full_name, created_at)
+        SELECT DISTINCT full_name, now() AT TIME ZONE 'utc' FROM attendance_incoming
+        ON CONFLICT (full_name) DO NOTHING
+        """
+    )
+    created, updated = connection.exec_driver_sql(
+        """
+        WITH upserted AS (
+            INSERT INTO attendance (person_id, status, date, note, version, updated_at)
+            SELECT people.id, incoming.status, incoming.date, incoming.note, incoming.version, incoming.updated_at
+            FROM attendance_incoming AS incoming JOIN people ON people.full_name = incoming.full_name
+            ON CONFLICT (person_id, date) DO UPDATE SET
+                status = EXCLUDED.status,
+                note = EXCLUDED.note,
+                version = EXCLUDED.version,
+                updated_at = EXCLUDED.updated_at,
+                deleted_at = NULL
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+        """
+    ).one()
+    connection.exec_driver_sql("TRUNCATE attendance_incoming")
+    return created, updated
+
+
+def _get_live_employee(db: Session, employee_id: int) -> models.Employee:
+    # Locked and re-read: the rollup delta is computed from this state, so it must be the latest committed one.
+    db_employee = (
+        db.query(models.Employee)
+        .filter(models.Employee.id == employee_id, models.Employee.deleted_at.is_(None))
+        .populate_existing()
+        .with_for_update(of=models.Employee)
+        .first()
+    )
     if not db_employee:
         raise ValueError("Employee not found")
-    for field, value in payload.dict(exclude_unset=True).items():
-        setattr(db_employee, field, value)
-    db.commit()
-    db.refresh(db_employee)
+    return db_employee
+
+
+def update_employee(
+    db: Session, employee_id: int, payload: schemas.EmployeeUpdate, commit: bool = True
+) -> models.Employee:
+    changes = payload.dict(exclude_unset=True)
+    # The version row is locked before the record, in the same order as every other write.
+    # A live record is never in an archived month, so only a new date needs the archive check.
+    version = bump_data_version(db, [changes["date"]] if "date" in changes else [])
+    db_employee = _get_live_employee(db, employee_id)
+    previous = (db_employee.date, db_employee.status)
+    full_name = changes.pop("full_name", None)
+    person = _person(db, full_name) if full_name else db_employee.person
+    day = changes.get("date", db_employee.date)
+    tombstone = None
+    if person.id != db_employee.person_id or day != db_employee.date:
+        tombstone = _key_tombstone(db, employee_id, person.id, day)
+    if tombstone is not None:
+        # The new key belongs to a deleted record: it is revived with the new values and this record is
+        # deleted instead, so both changes reach synced clients through the change feed.
+        for field in ("status", "note"):
+            setattr(tombstone, field, changes.get(field, getattr(db_employee, field)))
+        tombstone.deleted_at = None
+        tombstone.version = version
+        db_employee.deleted_at = datetime.utcnow()
+        db_employee.version = version
+        broker.publish(db, "employee.deleted", {"version": version, "id": db_employee.id})
+        log_manager.add("INFO", f"Moved employee record #{db_employee.id} onto deleted record #{tombstone.id}")
+        db_employee = tombstone
+    else:
+        db_employee.person = person
+        for field, value in changes.items():
+            setattr(db_employee, field, value)
+        db_employee.version = version
+    _apply_daily_deltas(db, _daily_deltas([(db_employee.date, db_employee.status)], [previous]))
+    db.flush()
+    _publish_employee(db, "employee.updated", db_employee, db_employee.version)
+    _finish_write(db, db_employee, commit)
     log_manager.add("INFO", f"Updated employee {db_employee.full_name} (#{db_employee.id})")
     return db_employee
 
 
-def delete_employee(db: Session, employee_id: int) -> None:
-    db_employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
-    if not db_employee:
-        raise ValueError("Employee not found")
-    db.delete(db_employee)
-    db.commit()
+def _key_tombstone(db: Session, employee_id: int, person_id: int, day: date) -> Optional[models.Employee]:
+    # A deleted record still holds its key; it is returned so the caller can reuse it.
+    other = db.scalars(
+        select(models.Employee).where(
+            models.Employee.person_id == person_id, models.Employee.date == day, models.Employee.id != employee_id
+        )
+    ).first()
+    if other is not None and other.deleted_at is None:
+        raise DuplicateEmployeeError(f"Employee #{person_id} already has a record for {day}")
+    return other
+
+
+def _finish_write(db: Session, db_employee: models.Employee, commit: bool) -> None:
+    # Callers batching several writes into one transaction pass commit=False and commit themselves.
+    if commit:
+        db.commit()
+        db.refresh(db_employee)
+    else:
+        db.flush()
+
+
+def _publish_employee(db: Session, event_type: str, db_employee: models.Employee, version: int) -> None:
+    employee = schemas.Employee.model_validate(db_employee, from_attributes=True)
+    broker.publish(db, event_type, {"version": version, "employee": employee.model_dump(mode="json")})
+
+
+def delete_employee(db: Session, employee_id: int, commit: bool = True) -> None:
+    version = bump_data_version(db)
+    db_employee = _get_live_employee(db, employee_id)
+    db_employee.deleted_at = datetime.utcnow()
+    db_employee.version = version
+    _apply_daily_deltas(db, _daily_deltas([], [(db_employee.date, db_employee.status)]))
+    broker.publish(db, "employee.deleted", {"version": db_employee.version, "id": employee_id})
+    _finish_write(db, db_employee, commit)
     log_manager.add("INFO", f"Removed employee {db_employee.full_name} (#{db_employee.id})")
 
 
+def bulk_update_employees(
+    db: Session,
+    changes: Dict,
+    ids: Optional[Sequence[int]] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    full_names: Optional[Sequence[str]] = None,
+) -> int:
+    # One UPDATE for every matching live record; archived months have no live rows left to match.
+    version = bump_data_version(db)
+    stmt = _filter_employees(update(models.Employee), start, end)
+    if ids is not None:
+        stmt = stmt.where(models.Employee.id.in_(ids))
+    if full_names is not None:
+        people = select(models.Person.id).where(models.Person.full_name.in_(full_names))
+        stmt = stmt.where(models.Employee.person_id.in_(people))
+    stmt = stmt.values(**changes, version=version, updated_at=datetime.utcnow()).returning(models.Employee.date)
+    days = db.execute(stmt.execution_options(synchronize_session=False)).scalars().all()
+    if not days:
+        db.rollback()
+        return 0
+    if "status" in changes:
+        refresh_daily_totals(db, days)
+    broker.publish(db, "employees.bulk_updated", {"version": version, "count": len(days)})
+    db.commit()
+    log_manager.add("INFO", f"Bulk updated {len(days)} employee records ({', '.join(sorted(changes))})")
+    return len(days)
+
+
+def copy_roster(db: Session, source: date, target: date, overwrite: bool = False) -> Tuple[int, int]:
+    # A single INSERT ... SELECT; existing records on the target day are kept unless overwrite is set.
+    version = bump_data_version(db, [target])
+    table = models.Employee.__table__
+    live_on_source = and_(table.c.deleted_at.is_(None), table.c.date == source)
+    total = db.execute(select(func.count(table.c.id)).where(live_on_source)).scalar_one()
+    rows = select(
+        table.c.person_id,
+        table.c.status,
+        literal(target, table.c.date.type),
+        table.c.note,
+        literal(version, table.c.version.type),
+        literal(datetime.utcnow(), table.c.updated_at.type),
+    ).where(live_on_source)
+    stmt = _dialect_insert(db, table).from_select(
+        ["person_id", "status", "date", "note", "version", "updated_at"], rows
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.person_id, table.c.date],
+        set_={
+            "status": stmt.excluded.status,
+            "note": stmt.excluded.note,
+            "version": stmt.excluded.version,
+            "updated_at": stmt.excluded.updated_at,
+            "deleted_at": None,
+        },
+        # Deleted records still hold the key and are always replaced.
+        where=None if overwrite else table.c.deleted_at.is_not(None),
+    )
+    copied = len(db.execute(stmt.returning(table.c.id)).all())
+    if not copied:
+        db.rollback()
+        return 0, total
+    refresh_daily_totals(db, [target])
+    broker.publish(
+        db,
+        "employees.roster_copied",
+        {"version": version, "source": source.isoformat(), "target": target.isoformat(), "count": copied},
+    )
+    db.commit()
+    log_manager.add("INFO", f"Copied {copied} of {total} records from {source} to {target}")
+    return copied, total - copied
+
+
 def update_credentials(db: Session, user: models.User, payload: schemas.UserUpdate) -> models.User:
+    previous_username = user.username
     if payload.username:
         user.username = payload.username
     if payload.password:
         user.password_hash = get_password_hash(payload.password)
+    # Tokens carry the version they were issued with, so bumping it revokes every older token.
+    user.token_version = (user.token_version or 0) + 1
+    broker.publish(
+        db, CREDENTIALS_EVENT, {"usernames": sorted({previous_username, user.username})}, internal=True
+    )
     db.commit()
     db.refresh(user)
     log_manager.add("INFO", f"Credentials updated for user {user.username}")
@@ -97,6 +668,8 @@ def update_credentials(db: Session, user: models.User, payload: schemas.UserUpda
 def update_lunch_price(db: Session, price: float) -> models.Settings:
     settings = ensure_settings(db)
     settings.lunch_price = price
+    broker.publish(db, SETTINGS_EVENT, {"version": bump_data_version(db), "lunch_price": price})
+    db.info[_SETTINGS_CHANGED_KEY] = True
     db.commit()
     db.refresh(settings)
     log_manager.add("INFO", f"Lunch price updated to {price}")
@@ -104,12 +677,356 @@ def update_lunch_price(db: Session, price: float) -> models.Settings:
 
 
 def aggregate_cost(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[int, float]:
-    settings = ensure_settings(db)
-    query = db.query(func.count()).select_from(models.Employee).filter(models.Employee.status.is_(True))
-    if start:
-        query = query.filter(models.Employee.date >= start)
-    if end:
-        query = query.filter(models.Employee.date <= end)
-    count = query.scalar() or 0
+    settings = get_settings(db)
+    query = _filter_daily_totals(select(func.sum(models.DailyParticipation.participants)), start, end)
+    count = db.execute(query).scalar() or 0
     total = count * settings.lunch_price
     return count, total
+
+
+def list_daily_totals(
+    db: Session, start: Optional[date] = None, end: Optional[date] = None
+) -> List[models.DailyParticipation]:
+    query = _filter_daily_totals(select(models.DailyParticipation), start, end)
+    return list(db.scalars(query.order_by(models.DailyParticipation.date.asc())))
+
+
+def _filter_daily_totals(query, start: Optional[date], end: Optional[date]):
+    if start:
+        query = query.where(models.DailyParticipation.date >= start)
+    if end:
+        query = query.where(models.DailyParticipation.date <= end)
+    return query
+
+
+def _daily_deltas(
+    added: Iterable[Tuple[date, Optional[bool]]], removed: Iterable[Tuple[date, Optional[bool]]] = ()
+) -> Dict[date, Tuple[int, int]]:
+    counter: Counter = Counter()
+    for sign, entries in ((1, added), (-1, removed)):
+        for day, status in entries:
+            if day is None:
+                continue
+            counter[(day, bool(status))] += sign
+    deltas: Dict[date, Tuple[int, int]] = {}
+    for (day, status), delta in counter.items():
+        participants, non_participants = deltas.get(day, (0, 0))
+        if status:
+            participants += delta
+        else:
+            non_participants += delta
+        deltas[day] = (participants, non_participants)
+    return {day: values for day, values in deltas.items() if values != (0, 0)}
+
+
+def _dialect_insert(db: Session, model):
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _apply_daily_deltas(db: Session, deltas: Dict[date, Tuple[int, int]]) -> None:
+    if not deltas:
+        return
+    table = models.DailyParticipation
+    stmt = _dialect_insert(db, table).values(
+        [
+            {"date": day, "participants": participants, "non_participants": non_participants}
+            for day, (participants, non_participants) in deltas.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.date],
+        set_={
+            "participants": table.participants + stmt.excluded.participants,
+            "non_participants": table.non_participants + stmt.excluded.non_participants,
+        },
+    )
+    db.execute(stmt)
+
+
+def daily_totals_query():
+    participating = func.sum(case((models.Employee.status.is_(True), 1), else_=0))
+    return (
+        select(models.Employee.date, participating, func.count(models.Employee.id) - participating)
+        .where(models.Employee.deleted_at.is_(None), models.Employee.date.is_not(None))
+        .group_by(models.Employee.date)
+    )
+
+
+def refresh_daily_totals(db: Session, dates: Iterable[date]) -> None:
+    # Recounts only the given days; used where old values are unknown, e.g. after an upsert.
+    days = sorted({day for day in dates if day is not None})
+    table = models.DailyParticipation
+    for offset in range(0, len(days), DAILY_REFRESH_CHUNK):
+        chunk = days[offset : offset + DAILY_REFRESH_CHUNK]
+        stmt = _dialect_insert(db, table).from_select(
+            ["date", "participants", "non_participants"], daily_totals_query().where(models.Employee.date.in_(chunk))
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.date],
+            set_={"participants": stmt.excluded.participants, "non_participants": stmt.excluded.non_participants},
+        )
+        db.execute(stmt)
+        live_days = select(models.Employee.date).where(
+            models.Employee.deleted_at.is_(None), models.Employee.date.in_(chunk)
+        )
+        db.execute(delete(table).where(table.date.in_(chunk), table.date.not_in(live_days)))
+
+
+def rebuild_daily_totals(db: Session) -> None:
+    # Archived days have no live rows left, so their totals are kept as they were when archived.
+    archived_before = get_archived_before(db)
+    stale = delete(models.DailyParticipation)
+    if archived_before is not None:
+        stale = stale.where(models.DailyParticipation.date >= archived_before)
+    db.execute(stale)
+    db.execute(
+        insert(models.DailyParticipation).from_select(
+            ["date", "participants", "non_participants"], daily_totals_query()
+        )
+    )
+    db.commit()
+
+
+def ensure_daily_totals(db: Session) -> None:
+    has_totals = db.execute(select(models.DailyParticipation.date).limit(1)).first()
+    has_employees = db.execute(select(models.Employee.id).limit(1)).first()
+    if has_employees and not has_totals:
+        rebuild_daily_totals(db)
+        log_manager.add("INFO", "Rebuilt daily participation totals")
+
+
+def list_changes(
+    db: Session,
+    since: int,
+    after_id: int = 0,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 500,
+) -> List[Row]:
+    query = _with_names(select(*EMPLOYEE_COLUMNS, models.Employee.version, models.Employee.deleted_at)).where(
+        or_(
+            models.Employee.version > since,
+            and_(models.Employee.version == since, models.Employee.id > after_id),
+        )
+    )
+    if start:
+        query = query.where(models.Employee.date >= start)
+    if end:
+        query = query.where(models.Employee.date <= end)
+    query = query.order_by(models.Employee.version.asc(), models.Employee.id.asc()).limit(limit)
+    return db.execute(query).all()
+
+
+def get_purged_version(db: Session) -> int:
+    return db.execute(
+        select(models.DataVersion.purged_version).where(models.DataVersion.id == DATA_VERSION_ID)
+    ).scalar_one()
+
+
+def purge_tombstones(db: Session, retention_days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = models.Employee.deleted_at.is_not(None) & (models.Employee.deleted_at < cutoff)
+    watermark = db.execute(select(func.max(models.Employee.version)).where(expired)).scalar()
+    if watermark is None:
+        return 0
+    removed = db.execute(delete(models.Employee).where(expired)).rowcount
+    _raise_purged_version(db, watermark)
+    db.commit()
+    log_manager.add("INFO", f"Purged {removed} employee tombstones up to version {watermark}")
+    return removed
+
+
+def _raise_purged_version(db: Session, watermark: int) -> None:
+    # Clients that synced before a physically removed tombstone must do a full resync.
+    db.execute(
+        update(models.DataVersion)
+        .where(models.DataVersion.id == DATA_VERSION_ID, models.DataVersion.purged_version < watermark)
+        .values(purged_version=watermark)
+    )
+
+
+def get_idempotent_response(db: Session, key: str, request_hash: Optional[str] = None) -> Optional[Dict]:
+    record = db.get(models.IdempotencyKey, key)
+    if record is None or record.expires_at <= datetime.utcnow():
+        return None
+    if record.request_hash is not None and request_hash is not None and record.request_hash != request_hash:
+        raise IdempotencyKeyReusedError(f"Idempotency key {key} was used with a different request")
+    return record.response
+
+
+def store_idempotent_response(db: Session, key: str, response: Dict, request_hash: Optional[str] = None) -> None:
+    now = datetime.utcnow()
+    db.execute(
+        delete(models.IdempotencyKey).where(models.IdempotencyKey.key == key, models.IdempotencyKey.expires_at <= now)
+    )
+    db.add(
+        models.IdempotencyKey(
+            key=key,
+            request_hash=request_hash,
+            response=response,
+            created_at=now,
+            expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        )
+    )
+
+
+def purge_idempotency_keys(db: Session) -> int:
+    removed = db.execute(
+        delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at <= datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return removed
+
+
+def enqueue_webhook_event(db: Session, payload: Dict) -> models.WebhookEvent:
+    event = models.WebhookEvent(payload=payload, status="pending")
+    db.add(event)
+    db.commit()
+    return event
+
+
+def _webhook_lock_key(payload: Dict) -> Optional[Tuple[int, int]]:
+    if payload.get("employee_id"):
+        return WEBHOOK_RECORD_LOCK_CLASS, int(payload["employee_id"])
+    employee = payload.get("employee") or {}
+    if employee.get("full_name") and employee.get("date"):
+        digest = zlib.crc32(f"{employee['full_name']}|{employee['date']}".encode())
+        return WEBHOOK_ADD_LOCK_CLASS, digest - 2**31
+    return None
+
+
+def claim_webhook_events(db: Session, limit: int) -> List[models.WebhookEvent]:
+    # SKIP LOCKED lets several workers drain the queue without handing out the same rows twice.
+    query = (
+        select(models.WebhookEvent)
+        .where(models.WebhookEvent.status == "pending")
+        .order_by(models.WebhookEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if db.bind.dialect.name != "postgresql":
+        return list(db.scalars(query))
+    # Row locks alone let two workers split one record's events between them and commit them out of order.
+    # Each worker therefore takes every pending event of a record or none: it claims only the records whose
+    # advisory lock it wins, and that lock is held until the batch commits.
+    candidates = db.execute(
+        select(models.WebhookEvent.id, models.WebhookEvent.payload)
+        .where(models.WebhookEvent.status == "pending")
+        .order_by(models.WebhookEvent.id)
+        .limit(limit)
+    ).all()
+    keys = {row.id: _webhook_lock_key(row.payload) for row in candidates}
+    wanted = list(dict.fromkeys(key for key in keys.values() if key is not None))
+    held = set()
+    if wanted:
+        held = {
+            (row.classid, row.objid)
+            for row in db.execute(
+                text(
+                    "SELECT classid, objid FROM unnest(CAST(:classes AS integer[]), CAST(:objids AS integer[]))"
+                    " AS k(classid, objid) WHERE pg_try_advisory_xact_lock(classid, objid)"
+                ),
+                {"classes": [key[0] for key in wanted], "objids": [key[1] for key in wanted]},
+            )
+        }
+    ids = [event_id for event_id, key in keys.items() if key is None or key in held]
+    if not ids:
+        return []
+    return list(db.scalars(query.where(models.WebhookEvent.id.in_(ids))))
+
+
+def webhook_queue_stats(db: Session) -> Dict:
+    pending, oldest = db.execute(
+        select(func.count(), func.min(models.WebhookEvent.received_at)).where(models.WebhookEvent.status == "pending")
+    ).one()
+    failed = db.scalar(select(func.count()).where(models.WebhookEvent.status == "failed"))
+    last_processed = db.scalar(select(func.max(models.WebhookEvent.processed_at)))
+    return {
+        "pending": pending,
+        "failed": failed,
+        "oldest_pending_at": oldest,
+        "lag_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+        "last_processed_at": last_processed,
+    }
+
+
+def purge_webhook_events(db: Session, retention_hours: int = WEBHOOK_QUEUE_RETENTION_HOURS) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    removed = db.execute(
+        delete(models.WebhookEvent).where(
+            models.WebhookEvent.status != "pending", models.WebhookEvent.processed_at < cutoff
+        )
+    ).rowcount
+    db.commit()
+    return removed
+
+
+def list_logs(
+    db: Session,
+    levels: Optional[Sequence[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    search: Optional[str] = None,
+    before_id: Optional[int] = None,
+    limit: int = 100,
+) -> List[models.LogRecord]:
+    query = select(models.LogRecord)
+    if levels:
+        query = query.where(models.LogRecord.level.in_([level.upper() for level in levels]))
+    if since:
+        query = query.where(models.LogRecord.timestamp >= since)
+    if until:
+        query = query.where(models.LogRecord.timestamp <= until)
+    if search:
+        query = query.where(models.LogRecord.message.ilike(f"%{search}%"))
+    if before_id:
+        query = query.where(models.LogRecord.id < before_id)
+    return list(db.scalars(query.order_by(models.LogRecord.id.desc()).limit(limit)))
+
+
+def tail_logs(
+    db: Session, after_id: int, gaps: Sequence[int] = (), limit: int = 500
+) -> List[models.LogRecord]:
+    # Ids are allocated at insert but become visible at commit, so another worker's lower id can appear after
+    # a higher one was read; callers pass the ids they skipped and get them once they are committed.
+    condition = models.LogRecord.id > after_id
+    if gaps:
+        condition = or_(condition, models.LogRecord.id.in_(gaps))
+    query = select(models.LogRecord).where(condition).order_by(models.LogRecord.id).limit(limit)
+    return list(db.scalars(query))
+
+
+def last_log_id(db: Session) -> int:
+    return db.scalar(select(func.max(models.LogRecord.id))) or 0
+
+
+def purge_logs(db: Session, retention_days: int = LOG_RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    removed = db.execute(delete(models.LogRecord).where(models.LogRecord.timestamp < cutoff)).rowcount
+    db.commit()
+    return removed
+
+
+def create_job(db: Session, kind: str) -> models.Job:
+    job = models.Job(id=uuid.uuid4().hex, kind=kind, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: str, kind: Optional[str] = None) -> Optional[models.Job]:
+    query = db.query(models.Job).filter(models.Job.id == job_id)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    return query.first()
+
+
+def finish_job(db: Session, job: models.Job, status: str, error: Optional[str] = None) -> models.Job:
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    db.refresh(job)
+    return job
@@ -1,12 +1,82 @@
+import itertools
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, TypeVar, Union
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://root25:Admin2025@db:5432/obed")
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in {"1", "true", "yes"}
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in {"1", "true", "yes"}
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+PRIMARY_UNTIL_COOKIE = "obed_primary_until"
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+
+T = TypeVar("T")
+
+
+def _async_url(url: str) -> str:
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "postgresql":
+        return {}
+    options: Dict[str, Any] = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS:
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
 
-engine = create_engine(DATABASE_URL, future=True)
+
+engine = create_engine(DATABASE_URL, future=True, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
+# The async stack is opt-in: it needs asyncpg and shares the models and crud code through run_db.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL)) if DB_ASYNC else None
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+)
+
+replica_engines = [create_engine(url, future=True, **_engine_options(url)) for url in DATABASE_REPLICA_URLS]
+_replica_sessions = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica, future=True) for replica in replica_engines
+]
+_async_replica_sessions = [
+    async_sessionmaker(
+        create_async_engine(_async_url(url), **_engine_options(_async_url(url))),
+        autoflush=False,
+        expire_on_commit=False,
+    )
+    for url in (DATABASE_REPLICA_URLS if DB_ASYNC else [])
+]
+_replica_turn = itertools.count()
+
 Base = declarative_base()
 
 
@@ -16,3 +86,76 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def ReadSessionLocal() -> Session:
+    # Replicas are picked round-robin; without replicas reads go to the primary.
+    if not _replica_sessions:
+        return SessionLocal()
+    return _replica_sessions[next(_replica_turn) % len(_replica_sessions)]()
+
+
+def prefers_primary(request: Request) -> bool:
+    # A client that wrote recently reads from the primary so it sees its own changes despite replica lag.
+    marker = request.headers.get(PRIMARY_UNTIL_HEADER) or request.cookies.get(PRIMARY_UNTIL_COOKIE)
+    try:
+        return marker is not None and float(marker) > time.time()
+    except ValueError:
+        return False
+
+
+def primary_until() -> Optional[int]:
+    if not replica_engines:
+        return None
+    return int(time.time()) + REPLICA_STICKY_SECONDS
+
+
+async def get_session() -> AsyncIterator[Union[Session, AsyncSession]]:
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+async def get_read_session(request: Request) -> AsyncIterator[Union[Session, AsyncSession]]:
+    if not replica_engines or prefers_primary(request):
+        async for session in get_session():
+            yield session
+        return
+    if _async_replica_sessions:
+        factory = _async_replica_sessions[next(_replica_turn) % len(_async_replica_sessions)]
+        async with factory() as session:
+            yield session
+        return
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+async def run_db(db: Union[Session, AsyncSession], fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # crud stays synchronous: on asyncpg it runs via run_sync without a thread, otherwise in the threadpool.
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+@contextmanager
+def advisory_lock(key: int) -> Iterator[None]:
+    # Serializes one-off work (startup bootstrap) across workers; a no-op outside PostgreSQL.
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+            connection.commit()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import select
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .logs import log_manager
+
+EVENTS_CHANNEL = "obed_events"
+SUBSCRIBER_QUEUE_SIZE = 1000
+LISTEN_POLL_SECONDS = 5
+RECONNECT_DELAY_SECONDS = 3
+
+_PENDING_KEY = "pending_events"
+
+
+class EventBroker:
+    def __init__(self) -> None:
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        self._callbacks: List[Callable[[Dict[str, Any]], None]] = []
+
+    def publish(self, db: Session, event_type: str, data: Dict[str, Any], internal: bool = False) -> None:
+        # Internal events only reach in-process callbacks (cache invalidation), never SSE clients.
+        message = {"type": event_type, **data, "internal": True} if internal else {"type": event_type, **data}
+        payload = json.dumps(message, ensure_ascii=False, default=str)
+        if db.bind.dialect.name == "postgresql":
+            # NOTIFY is transactional: listeners in every worker see it only after COMMIT.
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_CHANNEL, "payload": payload})
+        else:
+            db.info.setdefault(_PENDING_KEY, []).append(payload)
+
+    def pending_mark(self, db: Session) -> int:
+        # Position in the session's undelivered events, taken before a savepoint; see discard_after().
+        return len(db.info.get(_PENDING_KEY, ()))
+
+    def discard_after(self, db: Session, mark: int) -> None:
+        # A rolled-back savepoint takes its NOTIFYs with it on PostgreSQL; the SQLite queue must match.
+        pending = db.info.get(_PENDING_KEY)
+        if pending is not None:
+            del pending[mark:]
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def add_callback(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self._callbacks.append(callback)
+
+    def dispatch(self, payload: str) -> None:
+        message = json.loads(payload)
+        for callback in self._callbacks:
+            try:
+                callback(message)
+            except Exception as exc:
+                log_manager.add("ERROR", f"Event callback failed: {exc}")
+        if message.get("internal"):
+            return
+        with self._lock:
+            subscribers: List[Tuple[asyncio.Queue, asyncio.AbstractEventLoop]] = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, payload)
+            except RuntimeError:
+                self.unsubscribe(queue)
+
+    def start(self, engine: Engine) -> None:
+        if engine.dialect.name != "postgresql" or self._listener is not None:
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, args=(engine,), name="event-listener", daemon=True)
+        self._listener.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=LISTEN_POLL_SECONDS + 1)
+            self._listener = None
+
+    def _listen(self, engine: Engine) -> None:
+        reconnecting = False
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = engine.raw_connection()
+                driver_connection = connection.driver_connection
+                driver_connection.autocommit = True
+                with driver_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+                if reconnecting:
+                    # Notifications sent while disconnected are lost; caches and clients must reload.
+                    self.dispatch(json.dumps({"type": "resync"}))
+                reconnecting = True
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([driver_connection], [], [], LISTEN_POLL_SECONDS)
+                    if not readable:
+                        continue
+                    driver_connection.poll()
+                    while driver_connection.notifies:
+                        self.dispatch(driver_connection.notifies.pop(0).payload)
+            except Exception as exc:
+                log_manager.add("ERROR", f"Event listener disconnected: {exc}")
+                self._stop.wait(RECONNECT_DELAY_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.invalidate()
+
+
+def _offer(queue: asyncio.Queue, payload: str) -> None:
+    try:
+        queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        # A client that fell this far behind should refetch instead of replaying deltas.
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(json.dumps({"type": "resync"}))
+
+
+broker = EventBroker()
+
+
+# Registered on the Session class so sync sessions behind AsyncSession dispatch events too.
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending(session: Session) -> None:
+    for payload in session.info.pop(_PENDING_KEY, []):
+        broker.dispatch(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
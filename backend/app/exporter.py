@@ -1,11 +1,9 @@
-from io import BytesIO
-from typing import Iterable, List
-
-import pandas as pd
-from fpdf import FPDF
+from typing import BinaryIO, Iterable, List
 
 from . import models
 
+EXCEL_HEADERS = ("№", "Ф.И.О", "Статус", "Дата")
+
 
 def _employees_to_rows(employees: Iterable[models.Employee], include_price: bool, price: float) -> List[dict]:
     rows = []
@@ -22,25 +20,38 @@ def _employees_to_rows(employees: Iterable[models.Employee], include_price: bool
     return rows
 
 
-def export_excel(employees: List[models.Employee], include_price: bool, price: float, total_cost: float) -> bytes:
-    rows = _employees_to_rows(employees, include_price, price)
-    df = pd.DataFrame(rows)
+def write_excel(
+    employees: Iterable[models.Employee], include_price: bool, price: float, total_cost: float, output: BinaryIO
+) -> None:
+    # openpyxl and fpdf are imported on first export so workers that only serve the API never load them.
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Отчет")
+    headers = list(EXCEL_HEADERS) + (["Стоимость"] if include_price else [])
+    sheet.append([_header_cell(sheet, header) for header in headers])
+    for index, emp in enumerate(employees, start=1):
+        row = [index, emp.full_name, "Участвует" if emp.status else "Не участвует", emp.date.strftime("%Y-%m-%d")]
+        if include_price:
+            row.append(price if emp.status else 0)
+        sheet.append(row)
     if include_price:
-        summary = {
-            "№": "",
-            "Ф.И.О": "",
-            "Статус": "",
-            "Дата": "Итого",
-            "Стоимость": total_cost,
-        }
-        df = pd.concat([df, pd.DataFrame([summary])], ignore_index=True)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Отчет")
-    return output.getvalue()
+        sheet.append(["", "", "", "Итого", total_cost])
+    workbook.save(output)
+
+
+def _header_cell(sheet, value: str):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.font = Font(bold=True)
+    return cell
 
 
 def export_pdf(employees: List[models.Employee], include_price: bool, price: float, total_cost: float) -> bytes:
+    from fpdf import FPDF
+
     rows = _employees_to_rows(employees, include_price, price)
     pdf = FPDF(orientation="P", unit="mm", format="A4")
     pdf.add_page()
@@ -0,0 +1,133 @@
+import os
+from io import BytesIO
+from datetime import date
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+from .logs import log_manager
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+MAX_REPORTED_REJECTIONS = int(os.getenv("IMPORT_MAX_REJECTIONS", "1000"))
+
+COLUMN_NAME = "Ф.И.О"
+COLUMN_STATUS = "Статус"
+COLUMN_DATE = "Дата"
+COLUMN_NOTE = "Примечание"
+REQUIRED_COLUMNS = {COLUMN_NAME, COLUMN_STATUS, COLUMN_DATE}
+
+STATUS_TRUE_VALUES = ["true", "1", "участвует", "yes", "да"]
+MAX_TEXT_LENGTH = 255
+
+# Header occupies the first spreadsheet row, so data row N is DataFrame index N - 2.
+FIRST_DATA_ROW = 2
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def read_workbook(content: bytes) -> "pd.DataFrame":
+    # pandas is loaded on first import job only; API workers that never import stay lighter.
+    import pandas as pd
+
+    try:
+        df = pd.read_excel(BytesIO(content))
+    except Exception as exc:  # pragma: no cover - error handling
+        raise ImportFileError(f"Не удалось прочитать файл: {exc}") from exc
+    if not REQUIRED_COLUMNS.issubset(set(df.columns)):
+        raise ImportFileError("Отсутствуют необходимые столбцы: Ф.И.О, Статус, Дата")
+    return df
+
+
+def _clean_text(series: "pd.Series") -> "pd.Series":
+    return series.astype("string").str.strip()
+
+
+def validate_rows(df: "pd.DataFrame", archived_before: Optional[date] = None) -> Tuple[List[Dict], List[Dict]]:
+    import pandas as pd
+
+    names = _clean_text(df[COLUMN_NAME])
+    statuses = _clean_text(df[COLUMN_STATUS]).str.lower().isin(STATUS_TRUE_VALUES)
+    dates = pd.to_datetime(df[COLUMN_DATE], errors="coerce", format="mixed")
+    if COLUMN_NOTE in df.columns:
+        notes = _clean_text(df[COLUMN_NOTE]).replace("", pd.NA)
+    else:
+        notes = pd.Series(pd.NA, index=df.index, dtype="string")
+
+    errors = pd.Series(pd.NA, index=df.index, dtype="string")
+    errors = errors.mask(notes.str.len().fillna(0) > MAX_TEXT_LENGTH, "Примечание длиннее 255 символов")
+    if archived_before is not None:
+        errors = errors.mask(dates < pd.Timestamp(archived_before), "Период закрыт и перенесен в архив")
+    errors = errors.mask(dates.isna(), "Некорректная дата")
+    errors = errors.mask(names.str.len().fillna(0) > MAX_TEXT_LENGTH, "Ф.И.О длиннее 255 символов")
+    errors = errors.mask(names.isna() | (names == ""), "Не указано Ф.И.О")
+
+    rejected_mask = errors.notna()
+    rejections = [
+        {"row": int(position) + FIRST_DATA_ROW, "error": str(message)}
+        for position, message in zip(df.index[rejected_mask], errors[rejected_mask])
+    ]
+
+    valid = ~rejected_mask
+    rows = [
+        {"full_name": name, "status": bool(status), "date": day.date(), "note": None if pd.isna(note) else note}
+        for name, status, day, note in zip(names[valid], statuses[valid], dates[valid], notes[valid])
+    ]
+    return rows, rejections
+
+
+def run_import(job_id: str, content: bytes) -> None:
+    db = SessionLocal()
+    try:
+        job = crud.get_job(db, job_id)
+        if job is None:
+            return
+        try:
+            _import_into(db, job, content)
+        except ImportFileError as exc:
+            db.rollback()
+            crud.finish_job(db, job, "failed", str(exc))
+            log_manager.add("WARN", f"Импорт {job_id} не выполнен: {exc}")
+        except Exception as exc:
+            db.rollback()
+            crud.finish_job(db, job, "failed", f"Ошибка импорта: {exc}")
+            log_manager.add("ERROR", f"Импорт {job_id} прерван: {exc}")
+    finally:
+        db.close()
+
+
+def _import_into(db: Session, job: models.Job, content: bytes) -> None:
+    job.status = "running"
+    db.commit()
+
+    rows, rejections = validate_rows(read_workbook(content), crud.get_archived_before(db))
+    job.total = len(rows) + len(rejections)
+    job.failed = len(rejections)
+    job.processed = len(rejections)
+    job.details = {
+        "rejections": rejections[:MAX_REPORTED_REJECTIONS],
+        "rejections_truncated": len(rejections) > MAX_REPORTED_REJECTIONS,
+    }
+    db.commit()
+
+    created = updated = 0
+    for offset in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = rows[offset : offset + IMPORT_CHUNK_SIZE]
+        chunk_created, chunk_updated = crud.bulk_upsert_employees(db, chunk)
+        created += chunk_created
+        updated += chunk_updated
+        job.succeeded += len(chunk)
+        job.processed += len(chunk)
+        job.details = {**job.details, "created": created, "updated": updated}
+        db.commit()
+
+    crud.finish_job(db, job, "completed")
+    log_manager.add(
+        "INFO", f"Импорт {job.id} завершен: добавлено {created}, обновлено {updated}, отклонено {job.failed}"
+    )
@@ -1,22 +1,87 @@
+import os
+import threading
 from collections import deque
 from datetime import datetime
-from typing import Deque, Dict, List
+from typing import Deque, Dict, Optional
 
-from .schemas import LogEntry
+from sqlalchemy import insert
 
-MAX_LOG_ENTRIES = 200
+from .database import engine
+from .models import LogRecord
+
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "1"))
+LOG_FLUSH_BATCH = int(os.getenv("LOG_FLUSH_BATCH", "500"))
+LOG_BUFFER_LIMIT = int(os.getenv("LOG_BUFFER_LIMIT", "10000"))
 
 
 class LogManager:
     def __init__(self) -> None:
-        self._entries: Deque[LogEntry] = deque(maxlen=MAX_LOG_ENTRIES)
+        self._pending: Deque[Dict] = deque()
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
 
     def add(self, level: str, message: str) -> None:
-        entry = LogEntry(timestamp=datetime.utcnow(), level=level.upper(), message=message)
-        self._entries.appendleft(entry)
+        with self._lock:
+            if len(self._pending) >= LOG_BUFFER_LIMIT:
+                self._pending.popleft()
+                self._dropped += 1
+            self._pending.append(
+                {"timestamp": datetime.utcnow(), "level": level.upper(), "message": message, "pid": os.getpid()}
+            )
+            full = len(self._pending) >= LOG_FLUSH_BATCH
+        if full:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=LOG_FLUSH_SECONDS + 5)
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            batch.append(
+                {
+                    "timestamp": datetime.utcnow(),
+                    "level": "WARN",
+                    "message": f"Log buffer overflow: {dropped} entries dropped",
+                    "pid": os.getpid(),
+                }
+            )
+        if not batch:
+            return
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(LogRecord), batch)
+        except Exception:
+            # Keep the entries for the next attempt; the buffer limit still bounds memory while the DB is down.
+            with self._lock:
+                room = max(LOG_BUFFER_LIMIT - len(self._pending), 0)
+                kept = batch[len(batch) - room:] if room else []
+                self._pending.extendleft(reversed(kept))
+                self._dropped += len(batch) - len(kept)
 
-    def list(self) -> List[LogEntry]:
-        return list(self._entries)
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(LOG_FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
 
 
 log_manager = LogManager()
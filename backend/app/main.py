@@ -1,53 +1,156 @@
+import asyncio
+import hashlib
 import os
 from datetime import date, datetime
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
-import pandas as pd
-from fastapi import Depends, FastAPI, File, HTTPException, Query, UploadFile
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from sqlalchemy.orm import Session
 
-from . import auth, crud, exporter, models, schemas
-from .database import Base, SessionLocal, engine, get_db
+from . import (
+    auth,
+    bootstrap,
+    crud,
+    importer,
+    metrics,
+    models,
+    pagination,
+    partitions,
+    reports,
+    responses,
+    schemas,
+    webhooks,
+)
+from .database import (
+    PRIMARY_UNTIL_COOKIE,
+    PRIMARY_UNTIL_HEADER,
+    REPLICA_STICKY_SECONDS,
+    ReadSessionLocal,
+    engine,
+    get_db,
+    get_read_session,
+    get_session,
+    primary_until,
+    run_db,
+)
+from .events import broker
 from .logs import log_manager
+from .maintenance import maintenance
 
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "obed-webhook-secret")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 TRUE_VALUES = {"true", "1", "участвует", "yes", "да", "on"}
 FALSE_VALUES = {"false", "0", "не участвует", "no", "нет", "off"}
 
+IMPORT_JOB_KIND = "import"
+
+AnySession = Union[Session, AsyncSession]
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+TOMBSTONE_PURGE_INTERVAL_SECONDS = 6 * 60 * 60
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = 60 * 60
+WEBHOOK_EVENTS_PURGE_INTERVAL_SECONDS = 60 * 60
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_RETRY_MS = 5000
+LOG_TAIL_POLL_SECONDS = 1.0
+LOG_TAIL_GAP_WINDOW = 1000
+LOG_PURGE_INTERVAL_SECONDS = 6 * 60 * 60
+PARTITION_INTERVAL_SECONDS = 24 * 60 * 60
+ARCHIVED_PERIOD_DETAIL = "Период закрыт и перенесен в архив"
+
 app = FastAPI(title="Обеды сотрудников", version="1.0.0")
 
+maintenance.register("purge-tombstones", TOMBSTONE_PURGE_INTERVAL_SECONDS, crud.purge_tombstones)
+maintenance.register("purge-idempotency-keys", IDEMPOTENCY_PURGE_INTERVAL_SECONDS, crud.purge_idempotency_keys)
+maintenance.register("purge-webhook-events", WEBHOOK_EVENTS_PURGE_INTERVAL_SECONDS, crud.purge_webhook_events)
+maintenance.register("purge-logs", LOG_PURGE_INTERVAL_SECONDS, crud.purge_logs)
+maintenance.register("ensure-partitions", PARTITION_INTERVAL_SECONDS, partitions.ensure_partitions)
+
+
+class PrimaryAfterWriteMiddleware:
+    # Marks clients that just wrote so their next reads skip the replicas for REPLICA_STICKY_SECONDS.
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_marker(message: Message) -> None:
+            until = primary_until()
+            if message["type"] == "http.response.start" and message["status"] < 400 and until is not None:
+                headers = MutableHeaders(scope=message)
+                headers.append(PRIMARY_UNTIL_HEADER, str(until))
+                headers.append(
+                    "Set-Cookie",
+                    f"{PRIMARY_UNTIL_COOKIE}={until}; Max-Age={REPLICA_STICKY_SECONDS}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_marker)
+
+
+app.add_middleware(PrimaryAfterWriteMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[PRIMARY_UNTIL_HEADER],
 )
 
 
 @app.on_event("startup")
 def on_startup() -> None:
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    try:
-        crud.ensure_default_user(db)
-        crud.ensure_settings(db)
-    finally:
-        db.close()
-    log_manager.add("INFO", "Сервис запущен")
+    timings = bootstrap.Timings()
+    # Interpreter start, imports and app construction: everything before this hook, in every worker.
+    elapsed = bootstrap.process_age()
+    if elapsed is not None:
+        timings.add("process start", elapsed)
+    if bootstrap.BOOTSTRAP_ON_STARTUP:
+        bootstrap.run(timings)
+    with timings.phase("background"):
+        log_manager.start()
+        broker.start(engine)
+        maintenance.start()
+        webhooks.worker.start()
+    log_manager.add("INFO", f"Сервис запущен (pid {os.getpid()}) за {timings.summary()}")
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    webhooks.worker.stop()
+    maintenance.stop()
+    broker.stop()
+    reports.shutdown()
+    log_manager.stop()
 
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login(payload: schemas.UserLogin, db: Session = Depends(get_db)):
-    # Ensure default credentials exist even if database initialization raced backend startup
-    crud.ensure_default_user(db)
-    user = auth.authenticate_user(db, payload.username, payload.password)
+async def login(payload: schemas.UserLogin, request: Request, db: AnySession = Depends(get_session)):
+    client = request.client.host if request.client else "unknown"
+    retry_after = auth.login_limiter.retry_after(payload.username, client)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много попыток входа, повторите позже",
+            headers={"Retry-After": str(retry_after)},
+        )
+    user = await auth.authenticate_user_async(db, payload.username, payload.password)
     if not user:
+        auth.login_limiter.record_failure(payload.username, client)
         raise HTTPException(status_code=401, detail="Неверные учетные данные")
-    access_token = auth.create_access_token({"sub": user.username})
+    auth.login_limiter.reset(payload.username, client)
+    access_token = auth.create_user_token(user)
     log_manager.add("INFO", f"Пользователь {user.username} вошел в систему")
     return schemas.Token(access_token=access_token)
 
@@ -55,190 +158,662 @@ def login(payload: schemas.UserLogin, db: Session = Depends(get_db)):
 @app.put("/auth/credentials")
 def update_credentials(
     payload: schemas.UserUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
     if not payload.username and not payload.password:
         raise HTTPException(status_code=400, detail="Нет данных для обновления")
-    crud.update_credentials(db, current_user, payload)
+    user = db.get(models.User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    crud.update_credentials(db, user, payload)
     return {"status": "ok"}
 
 
+def _etag(version: int, *parts: object) -> str:
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def _cache_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip() for candidate in header.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+def _conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    response.headers.update(_cache_headers(etag))
+    return None
+
+
 @app.get("/settings", response_model=schemas.SettingsResponse)
-def get_settings(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
+async def get_settings(
+    request: Request,
+    response: Response,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
 ):
-    settings = crud.ensure_settings(db)
-    return schemas.SettingsResponse(lunch_price=settings.lunch_price, updated_at=settings.updated_at)
+    not_modified = _conditional(request, response, _etag(await run_db(db, crud.get_data_version), "settings"))
+    if not_modified:
+        return not_modified
+    return await run_db(db, crud.get_settings)
 
 
 @app.put("/settings", response_model=schemas.SettingsResponse)
-def update_settings(
+async def update_settings(
     payload: schemas.SettingsUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_session),
 ):
-    settings = crud.update_lunch_price(db, payload.lunch_price)
+    settings = await run_db(db, crud.update_lunch_price, payload.lunch_price)
     return schemas.SettingsResponse(lunch_price=settings.lunch_price, updated_at=settings.updated_at)
 
 
 @app.get("/employees", response_model=schemas.EmployeeListResponse)
-def list_employees(
+async def list_employees(
+    request: Request,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
 ):
-    employee_records, lunch_price = crud.list_employees(db, start_date, end_date)
-    employees = [
-        schemas.Employee.model_validate(emp, from_attributes=True)
-        for emp in employee_records
+    etag = _etag(await run_db(db, crud.get_data_version), "employees", start_date, end_date)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    payload = await run_db(db, _employee_list, start_date, end_date)
+    return await run_in_threadpool(responses.json_response, request, payload, _cache_headers(etag))
+
+
+def _employee_list(db: Session, start_date: Optional[date], end_date: Optional[date]) -> Dict[str, object]:
+    # Read before the rows: a client resuming /employees/changes from it may see a change twice but never misses one.
+    version = crud.get_data_version(db)
+    rows, lunch_price = crud.list_employees(db, start_date, end_date)
+    participants, total_cost = crud.aggregate_cost(db, start_date, end_date)
+    return {
+        "version": version,
+        "employees": responses.rows_to_dicts(rows),
+        "lunch_price": lunch_price,
+        "total_participants": participants,
+        "total_cost": total_cost,
+    }
+
+
+@app.get("/employees/page", response_model=schemas.EmployeePage)
+async def list_employees_page(
+    request: Request,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[bool] = None,
+    name: Optional[str] = Query(None, description="Начало Ф.И.О."),
+    note: Optional[str] = Query(None, description="Фрагмент примечания"),
+    sort: str = Query(pagination.DEFAULT_SORT, description="date_desc, date_asc, name_asc, name_desc"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    if sort not in pagination.EMPLOYEE_SORTS:
+        raise HTTPException(status_code=400, detail="Неизвестная сортировка")
+    etag = _etag(
+        await run_db(db, crud.get_data_version), "page", start_date, end_date, status, name, note, sort, limit, cursor
+    )
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    payload = await run_db(db, _employee_page, start_date, end_date, status, name, note, sort, limit, cursor)
+    return await run_in_threadpool(responses.json_response, request, payload, _cache_headers(etag))
+
+
+def _employee_page(
+    db: Session,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    status: Optional[bool],
+    name: Optional[str],
+    note: Optional[str],
+    sort: str,
+    limit: int,
+    cursor: Optional[str],
+) -> Dict[str, object]:
+    try:
+        rows, next_cursor, totals = crud.page_employees(
+            db,
+            sort=sort,
+            limit=limit,
+            cursor=cursor,
+            start=start_date,
+            end=end_date,
+            status=status,
+            name_prefix=name.strip() if name else None,
+            note=note,
+        )
+    except pagination.CursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    price = crud.get_settings(db).lunch_price
+    total_count, participants = totals if totals is not None else (None, None)
+    return {
+        "employees": responses.rows_to_dicts(rows),
+        "next_cursor": next_cursor,
+        "total_count": total_count,
+        "lunch_price": price,
+        "total_participants": participants,
+        "total_cost": participants * price if participants is not None else None,
+    }
+
+
+@app.get("/employees/changes", response_model=schemas.EmployeeChangesResponse)
+async def list_employee_changes(
+    request: Request,
+    since: int = Query(..., ge=0, description="Версия, полученная при предыдущей синхронизации"),
+    after_id: int = Query(0, ge=0, description="Последний id из предыдущей страницы с той же версией"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    payload = await run_db(db, _employee_changes, since, after_id, start_date, end_date, limit)
+    return await run_in_threadpool(responses.json_response, request, payload)
+
+
+def _employee_changes(
+    db: Session, since: int, after_id: int, start_date: Optional[date], end_date: Optional[date], limit: int
+) -> Dict[str, object]:
+    if since < crud.get_purged_version(db):
+        raise HTTPException(status_code=410, detail="Удаленные записи уже очищены, требуется полная синхронизация")
+    version = crud.get_data_version(db)
+    rows = crud.list_changes(db, since, after_id, start_date, end_date, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [
+        {
+            "id": row.id,
+            "full_name": row.full_name,
+            "status": row.status,
+            "date": row.date,
+            "note": row.note,
+            "version": row.version,
+            "deleted": row.deleted_at is not None,
+        }
+        for row in rows
+    ]
+    if has_more:
+        next_since, next_after_id = rows[-1].version, rows[-1].id
+    else:
+        next_since, next_after_id = version, 0
+    return {
+        "version": version,
+        "changes": changes,
+        "has_more": has_more,
+        "next_since": next_since,
+        "next_after_id": next_after_id,
+    }
+
+
+@app.get("/summary/daily", response_model=schemas.DailySummaryResponse)
+async def daily_summary(
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    version = await run_db(db, crud.get_data_version)
+    not_modified = _conditional(request, response, _etag(version, "daily", start_date, end_date))
+    if not_modified:
+        return not_modified
+    return await run_db(db, _daily_summary, start_date, end_date)
+
+
+def _daily_summary(db: Session, start_date: Optional[date], end_date: Optional[date]) -> schemas.DailySummaryResponse:
+    price = crud.get_settings(db).lunch_price
+    days = [
+        schemas.DailySummary(
+            date=row.date,
+            participants=row.participants,
+            non_participants=row.non_participants,
+            total_cost=row.participants * price,
+        )
+        for row in crud.list_daily_totals(db, start_date, end_date)
+    ]
+    participants = sum(day.participants for day in days)
+    return schemas.DailySummaryResponse(
+        days=days, lunch_price=price, total_participants=participants, total_cost=participants * price
+    )
+
+
+@app.get("/summary/monthly", response_model=schemas.MonthlySummaryResponse)
+async def monthly_summary(
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    version = await run_db(db, crud.get_data_version)
+    not_modified = _conditional(request, response, _etag(version, "monthly", start_date, end_date))
+    if not_modified:
+        return not_modified
+    return await run_db(db, _monthly_summary, start_date, end_date)
+
+
+def _monthly_summary(
+    db: Session, start_date: Optional[date], end_date: Optional[date]
+) -> schemas.MonthlySummaryResponse:
+    days = crud.list_daily_totals(db, start_date, end_date)
+    return _monthly_response(db, ((row.date, row.participants, row.non_participants) for row in days))
+
+
+def _monthly_response(db: Session, days: Iterable[Tuple[date, int, int]]) -> schemas.MonthlySummaryResponse:
+    price = crud.get_settings(db).lunch_price
+    months: Dict[str, List[int]] = {}
+    for day, participants, non_participants in days:
+        counts = months.setdefault(day.strftime("%Y-%m"), [0, 0])
+        counts[0] += participants
+        counts[1] += non_participants
+    summaries = [
+        schemas.MonthlySummary(
+            month=month, participants=participants, non_participants=non_participants, total_cost=participants * price
+        )
+        for month, (participants, non_participants) in months.items()
     ]
-    participants = len([emp for emp in employees if emp.status])
-    total_cost = participants * lunch_price
-    return schemas.EmployeeListResponse(
-        employees=employees,
-        lunch_price=lunch_price,
+    participants = sum(month.participants for month in summaries)
+    return schemas.MonthlySummaryResponse(
+        months=summaries, lunch_price=price, total_participants=participants, total_cost=participants * price
+    )
+
+
+@app.get("/people", response_model=List[schemas.Person])
+async def list_people(
+    request: Request,
+    response: Response,
+    name: Optional[str] = Query(None, description="Начало Ф.И.О."),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    version = await run_db(db, crud.get_data_version)
+    not_modified = _conditional(request, response, _etag(version, "people", name))
+    if not_modified:
+        return not_modified
+    rows = await run_db(db, crud.list_people, name.strip() if name else None)
+    return [schemas.Person(id=row.id, full_name=row.full_name) for row in rows]
+
+
+@app.get("/people/{person_id}/attendance", response_model=schemas.PersonHistoryResponse)
+async def person_attendance(
+    person_id: int,
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    version = await run_db(db, crud.get_data_version)
+    not_modified = _conditional(request, response, _etag(version, "person", person_id, start_date, end_date))
+    if not_modified:
+        return not_modified
+    return await run_db(db, _person_attendance, person_id, start_date, end_date)
+
+
+def _person_attendance(
+    db: Session, person_id: int, start_date: Optional[date], end_date: Optional[date]
+) -> schemas.PersonHistoryResponse:
+    person = _get_person(db, person_id)
+    records = [
+        schemas.AttendanceRecord(id=row.id, date=row.date, status=row.status, note=row.note)
+        for row in crud.person_history(db, person_id, start_date, end_date)
+    ]
+    price = crud.get_settings(db).lunch_price
+    participants = sum(1 for record in records if record.status)
+    return schemas.PersonHistoryResponse(
+        person=schemas.Person(id=person.id, full_name=person.full_name),
+        records=records,
+        lunch_price=price,
         total_participants=participants,
-        total_cost=total_cost,
+        total_cost=participants * price,
     )
 
 
+@app.get("/people/{person_id}/summary/monthly", response_model=schemas.MonthlySummaryResponse)
+async def person_monthly_summary(
+    person_id: int,
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    version = await run_db(db, crud.get_data_version)
+    not_modified = _conditional(request, response, _etag(version, "person-monthly", person_id, start_date, end_date))
+    if not_modified:
+        return not_modified
+    return await run_db(db, _person_monthly_summary, person_id, start_date, end_date)
+
+
+def _person_monthly_summary(
+    db: Session, person_id: int, start_date: Optional[date], end_date: Optional[date]
+) -> schemas.MonthlySummaryResponse:
+    _get_person(db, person_id)
+    rows = crud.person_history(db, person_id, start_date, end_date)
+    return _monthly_response(db, ((row.date, int(bool(row.status)), int(not row.status)) for row in reversed(rows)))
+
+
+def _get_person(db: Session, person_id: int) -> models.Person:
+    person = crud.get_person(db, person_id)
+    if person is None:
+        raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    return person
+
+
 @app.post("/employees", response_model=schemas.Employee)
-def add_employee(
+async def add_employee(
     payload: schemas.EmployeeCreate,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
+    response: Response,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_session),
 ):
-    created = crud.create_employee(db, payload)
-    return schemas.Employee.model_validate(created, from_attributes=True)
+    # Same person and date overwrite the existing record: 201 for a new one, 200 for an update.
+    try:
+        employee, created = await run_db(db, crud.upsert_employee, payload)
+    except crud.ArchivedPeriodError as exc:
+        raise HTTPException(status_code=409, detail=ARCHIVED_PERIOD_DETAIL) from exc
+    response.status_code = 201 if created else 200
+    return schemas.Employee.model_validate(employee, from_attributes=True)
 
 
 @app.put("/employees/{employee_id}", response_model=schemas.Employee)
-def edit_employee(
+async def edit_employee(
     employee_id: int,
     payload: schemas.EmployeeUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_session),
 ):
     try:
-        updated = crud.update_employee(db, employee_id, payload)
+        updated = await run_db(db, crud.update_employee, employee_id, payload)
+    except crud.DuplicateEmployeeError as exc:
+        raise HTTPException(status_code=409, detail="Запись для этого сотрудника на эту дату уже существует") from exc
+    except crud.ArchivedPeriodError as exc:
+        raise HTTPException(status_code=409, detail=ARCHIVED_PERIOD_DETAIL) from exc
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
     return schemas.Employee.model_validate(updated, from_attributes=True)
 
 
 @app.delete("/employees/{employee_id}")
-def remove_employee(
+async def remove_employee(
     employee_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_session),
 ):
     try:
-        crud.delete_employee(db, employee_id)
+        await run_db(db, crud.delete_employee, employee_id)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
     return {"status": "deleted"}
 
 
-@app.post("/employees/import")
+@app.post("/employees/bulk-update", response_model=schemas.EmployeeBulkUpdateResponse)
+async def bulk_update_employees(
+    payload: schemas.EmployeeBulkUpdate,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_session),
+):
+    changes = {}
+    if payload.status is not None:
+        changes["status"] = payload.status
+    if "note" in payload.model_fields_set:
+        changes["note"] = payload.note
+    if not changes:
+        raise HTTPException(status_code=400, detail="Нет данных для обновления")
+    if payload.ids is None and payload.full_names is None and not payload.start_date and not payload.end_date:
+        raise HTTPException(status_code=400, detail="Не указаны записи для обновления")
+    if payload.start_date and payload.end_date and payload.start_date > payload.end_date:
+        raise HTTPException(status_code=400, detail="Дата начала позже даты окончания")
+    updated = await run_db(
+        db,
+        crud.bulk_update_employees,
+        changes,
+        ids=payload.ids,
+        start=payload.start_date,
+        end=payload.end_date,
+        full_names=payload.full_names,
+    )
+    return schemas.EmployeeBulkUpdateResponse(updated=updated)
+
+
+@app.post("/employees/copy", response_model=schemas.RosterCopyResponse)
+async def copy_roster(
+    payload: schemas.RosterCopyRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_session),
+):
+    if payload.source_date == payload.target_date:
+        raise HTTPException(status_code=400, detail="Даты копирования совпадают")
+    try:
+        copied, skipped = await run_db(
+            db, crud.copy_roster, payload.source_date, payload.target_date, payload.overwrite
+        )
+    except crud.ArchivedPeriodError as exc:
+        raise HTTPException(status_code=409, detail=ARCHIVED_PERIOD_DETAIL) from exc
+    return schemas.RosterCopyResponse(copied=copied, skipped=skipped)
+
+
+@app.post("/employees/import", response_model=schemas.ImportJobResponse, status_code=202)
 def import_employees(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    content = file.file.read()
+    if not content:
+        raise HTTPException(status_code=400, detail="Файл пуст")
+    job = crud.create_job(db, IMPORT_JOB_KIND)
+    background_tasks.add_task(importer.run_import, job.id, content)
+    log_manager.add("INFO", f"Импорт {job.id} поставлен в очередь ({file.filename})")
+    return _import_job_response(job)
+
+
+@app.get("/employees/import/{job_id}", response_model=schemas.ImportJobResponse)
+def import_status(
+    job_id: str,
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
+    job = crud.get_job(db, job_id, IMPORT_JOB_KIND)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача импорта не найдена")
+    return _import_job_response(job)
+
+
+def _import_job_response(job: models.Job) -> schemas.ImportJobResponse:
+    details = job.details or {}
+    return schemas.ImportJobResponse(
+        job_id=job.id,
+        status=job.status,
+        total_rows=job.total or 0,
+        processed_rows=job.processed or 0,
+        imported=job.succeeded or 0,
+        created=details.get("created", 0),
+        updated=details.get("updated", 0),
+        rejected=job.failed or 0,
+        rejections=details.get("rejections", []),
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+
+async def _render_export(
+    request: Request, db: Session, fmt: str, start_date: date, end_date: date, include_price: bool
+) -> Response:
+    # Rendering runs in the report process pool, never on a request worker.
+    version = await run_in_threadpool(crud.get_data_version, db)
+    etag = _etag(version, fmt, start_date, end_date, include_price)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    settings = await run_in_threadpool(crud.get_settings, db)
     try:
-        df = pd.read_excel(file.file)
-    except Exception as exc:  # pragma: no cover - error handling
-        raise HTTPException(status_code=400, detail=f"Не удалось прочитать файл: {exc}") from exc
-    required_columns = {"Ф.И.О", "Статус", "Дата"}
-    if not required_columns.issubset(set(df.columns)):
-        raise HTTPException(status_code=400, detail="Отсутствуют необходимые столбцы: Ф.И.О, Статус, Дата")
-    created = 0
-    for _, row in df.iterrows():
-        try:
-            employee = schemas.EmployeeCreate(
-                full_name=str(row["Ф.И.О"]).strip(),
-                status=str(row["Статус"]).strip().lower() in {"true", "1", "участвует", "yes", "да"},
-                date=pd.to_datetime(row["Дата"]).date(),
-                note=row.get("Примечание") if "Примечание" in df.columns else None,
-            )
-            crud.create_employee(db, employee)
-            created += 1
-        except Exception as exc:  # pragma: no cover - skip invalid rows
-            log_manager.add("WARN", f"Строка пропущена: {exc}")
-    return {"imported": created}
-
-
-def _build_attachment_response(content: bytes, filename: str, media_type: str) -> Response:
-    headers = {"Content-Disposition": f"attachment; filename={filename}"}
-    return Response(content=content, media_type=media_type, headers=headers)
+        path = await asyncio.wrap_future(
+            reports.submit(fmt, start_date, end_date, include_price, settings.lunch_price, version)
+        )
+    except Exception as exc:
+        log_manager.add("ERROR", f"Не удалось сформировать отчет {fmt}: {exc}")
+        raise HTTPException(status_code=500, detail="Не удалось сформировать отчет") from exc
+    return FileResponse(
+        path,
+        media_type=reports.media_type(fmt),
+        filename=reports.filename(fmt, start_date, end_date),
+        headers=_cache_headers(etag),
+    )
 
 
 @app.get("/employees/export/excel")
-def download_excel(
+async def download_excel(
+    request: Request,
     start_date: date,
     end_date: date,
     include_price: bool = True,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
-    employees, price = crud.list_employees(db, start_date, end_date)
-    participants = len([emp for emp in employees if emp.status])
-    total_cost = participants * price
-    content = exporter.export_excel(employees, include_price, price, total_cost)
-    filename = f"employees_{start_date}_{end_date}.xlsx"
-    return _build_attachment_response(
-        content,
-        filename,
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    return await _render_export(request, db, "excel", start_date, end_date, include_price)
 
 
 @app.get("/employees/export/pdf")
-def download_pdf(
+async def download_pdf(
+    request: Request,
     start_date: date,
     end_date: date,
     include_price: bool = True,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
-    employees, price = crud.list_employees(db, start_date, end_date)
-    participants = len([emp for emp in employees if emp.status])
-    total_cost = participants * price
-    content = exporter.export_pdf(employees, include_price, price, total_cost)
-    filename = f"employees_{start_date}_{end_date}.pdf"
-    return _build_attachment_response(content, filename, "application/pdf")
+    return await _render_export(request, db, "pdf", start_date, end_date, include_price)
+
+
+@app.post("/exports", response_model=schemas.ExportJobResponse, status_code=202)
+def create_export(
+    payload: schemas.ExportRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    if payload.start_date > payload.end_date:
+        raise HTTPException(status_code=400, detail="Дата начала позже даты окончания")
+    price = crud.get_settings(db).lunch_price
+    version = crud.get_data_version(db)
+    job = crud.create_job(db, reports.EXPORT_JOB_KIND)
+    job.details = {
+        "format": payload.format,
+        "filename": reports.filename(payload.format, payload.start_date, payload.end_date),
+    }
+    db.commit()
+    reports.start_job(
+        job.id, payload.format, payload.start_date, payload.end_date, payload.include_price, price, version
+    )
+    db.refresh(job)
+    return _export_job_response(job)
+
+
+@app.get("/exports/{job_id}", response_model=schemas.ExportJobResponse)
+def export_status(
+    job_id: str,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    return _export_job_response(_get_export_job(db, job_id))
+
+
+@app.get("/exports/{job_id}/download")
+def export_download(
+    job_id: str,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    job = _get_export_job(db, job_id)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail="Отчет еще не готов")
+    details = job.details or {}
+    path = details.get("path")
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Срок хранения отчета истек, запросите его заново")
+    return FileResponse(path, media_type=reports.media_type(details["format"]), filename=details["filename"])
+
+
+def _get_export_job(db: Session, job_id: str) -> models.Job:
+    job = crud.get_job(db, job_id, reports.EXPORT_JOB_KIND)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача экспорта не найдена")
+    return job
+
+
+def _export_job_response(job: models.Job) -> schemas.ExportJobResponse:
+    details = job.details or {}
+    return schemas.ExportJobResponse(
+        job_id=job.id,
+        status=job.status,
+        format=details.get("format", ""),
+        filename=details.get("filename", ""),
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
 
 
 @app.post("/webhook/employee")
-def webhook_employee(payload: schemas.WebhookPayload, db: Session = Depends(get_db)):
+async def webhook_employee(
+    payload: schemas.WebhookPayload, response: Response, db: AnySession = Depends(get_session)
+):
     if payload.secret != WEBHOOK_SECRET:
         raise HTTPException(status_code=403, detail="Неверный секретный ключ")
-    action = payload.action.lower()
-    if action == "add":
-        if not payload.employee:
-            raise HTTPException(status_code=400, detail="Нет данных сотрудника для добавления")
-        employee = crud.create_employee(db, payload.employee)
-        return {"status": "added", "id": employee.id}
-    if action == "update":
-        if not payload.employee_id or not payload.update:
-            raise HTTPException(status_code=400, detail="Необходимо указать employee_id и update")
-        try:
-            employee = crud.update_employee(db, payload.employee_id, payload.update)
-        except ValueError as exc:
-            raise HTTPException(status_code=404, detail=str(exc)) from exc
-        return {"status": "updated", "id": employee.id}
-    if action == "delete":
-        if not payload.employee_id:
-            raise HTTPException(status_code=400, detail="Необходимо указать employee_id")
-        try:
-            crud.delete_employee(db, payload.employee_id)
-        except ValueError as exc:
-            raise HTTPException(status_code=404, detail=str(exc)) from exc
-        return {"status": "deleted", "id": payload.employee_id}
-    raise HTTPException(status_code=400, detail="Неизвестное действие")
+    action = schemas.WebhookAction(**payload.model_dump(exclude={"secret"}, exclude_unset=True))
+    return await _handle_webhook(db, action, response)
+
+
+async def _handle_webhook(db: AnySession, action: schemas.WebhookAction, response: Response) -> Dict[str, object]:
+    if not webhooks.is_queue_mode():
+        return await run_db(db, webhooks.apply_action, action)
+    event = await run_db(db, webhooks.enqueue, action)
+    response.status_code = 202
+    return {"status": "queued", "event_id": event.id}
+
+
+@app.get("/webhook/queue", response_model=schemas.WebhookQueueStats)
+async def webhook_queue_stats(
+    current_user: auth.Principal = Depends(auth.get_current_user), db: AnySession = Depends(get_read_session)
+):
+    return schemas.WebhookQueueStats(mode=webhooks.WEBHOOK_MODE, **await run_db(db, crud.webhook_queue_stats))
+
+
+@app.post("/webhook/employee/batch", response_model=schemas.WebhookBatchResponse)
+async def webhook_employee_batch(
+    payload: schemas.WebhookBatchPayload,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: AnySession = Depends(get_session),
+):
+    if payload.secret != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="Неверный секретный ключ")
+    try:
+        result, replayed = await run_db(
+            db, webhooks.apply_batch, payload.actions, idempotency_key or payload.idempotency_key
+        )
+    except crud.IdempotencyKeyReusedError as exc:
+        raise HTTPException(status_code=422, detail="Ключ идемпотентности уже использован с другими данными") from exc
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
 def _parse_status(status: Optional[str]) -> Optional[bool]:
@@ -267,7 +842,8 @@ def _validate_query_secret(key: str) -> None:
 
 
 @app.get("/webhook/employee")
-def webhook_employee_query(
+async def webhook_employee_query(
+    response: Response,
     key: str = Query(..., description="Секретный ключ"),
     action: str = Query(..., description="add/update/delete"),
     employee_id: Optional[int] = Query(None, description="ID сотрудника для update/delete"),
@@ -276,7 +852,7 @@ def webhook_employee_query(
     status: Optional[str] = Query(None, description="Статус: true/false или участвует/не участвует"),
     date_param: Optional[str] = Query(None, alias="date", description="Дата в формате YYYY-MM-DD"),
     note: Optional[str] = Query(None, description="Примечание"),
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(get_session),
 ):
     _validate_query_secret(key)
     normalized_action = action.lower()
@@ -292,8 +868,7 @@ def webhook_employee_query(
             date=_parse_date(date_param) or datetime.utcnow().date(),
             note=note,
         )
-        created = crud.create_employee(db, employee_payload)
-        return {"status": "added", "id": created.id}
+        return await _handle_webhook(db, schemas.WebhookAction(action="add", employee=employee_payload), response)
 
     if normalized_action == "update":
         if not employee_id:
@@ -310,24 +885,121 @@ def webhook_employee_query(
             update_fields["note"] = note
         if not any(value is not None for value in update_fields.values()):
             raise HTTPException(status_code=400, detail="Нет данных для обновления")
-        try:
-            crud.update_employee(db, employee_id, schemas.EmployeeUpdate(**update_fields))
-        except ValueError as exc:
-            raise HTTPException(status_code=404, detail=str(exc)) from exc
-        return {"status": "updated", "id": employee_id}
+        update_action = schemas.WebhookAction(
+            action="update", employee_id=employee_id, update=schemas.EmployeeUpdate(**update_fields)
+        )
+        return await _handle_webhook(db, update_action, response)
 
     if normalized_action == "delete":
         if not employee_id:
             raise HTTPException(status_code=400, detail="Не указан employee_id для удаления")
-        try:
-            crud.delete_employee(db, employee_id)
-        except ValueError as exc:
-            raise HTTPException(status_code=404, detail=str(exc)) from exc
-        return {"status": "deleted", "id": employee_id}
+        return await _handle_webhook(db, schemas.WebhookAction(action="delete", employee_id=employee_id), response)
 
     raise HTTPException(status_code=400, detail="Неизвестное действие")
 
 
+@app.get("/events")
+async def stream_events(request: Request, current_user: auth.Principal = Depends(auth.get_stream_user)):
+    queue = broker.subscribe()
+    return StreamingResponse(
+        _event_stream(request, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _event_stream(request: Request, queue: asyncio.Queue):
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while not await request.is_disconnected():
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {payload}\n\n"
+    finally:
+        broker.unsubscribe(queue)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Неверный токен метрик")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/logs", response_model=schemas.LogResponse)
-def get_logs(current_user: models.User = Depends(auth.get_current_user)):
-    return schemas.LogResponse(entries=log_manager.list())
+async def get_logs(
+    level: Optional[str] = Query(None, description="Уровни через запятую: INFO,ERROR"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    q: Optional[str] = Query(None, description="Фрагмент сообщения"),
+    cursor: Optional[int] = Query(None, ge=1, description="next_cursor из предыдущей страницы"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AnySession = Depends(get_read_session),
+):
+    levels = [part.strip() for part in level.split(",") if part.strip()] if level else None
+    records = await run_db(db, crud.list_logs, levels, since, until, q, cursor, limit + 1)
+    next_cursor = records[limit - 1].id if len(records) > limit else None
+    return schemas.LogResponse(
+        entries=[schemas.LogEntry.model_validate(record, from_attributes=True) for record in records[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/logs/stream")
+async def stream_logs(
+    request: Request,
+    after: Optional[int] = Query(None, ge=0, description="Последний полученный id"),
+    current_user: auth.Principal = Depends(auth.get_stream_user),
+):
+    last_event_id = request.headers.get("last-event-id")
+    if after is None and last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+    return StreamingResponse(
+        _log_stream(request, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _read_logs(fn, *args):
+    db = ReadSessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def _log_stream(request: Request, after: Optional[int]):
+    # Entries reach the table through each worker's flusher, so polling it shows every worker's logs.
+    if after is None:
+        after = await run_in_threadpool(_read_logs, crud.last_log_id)
+    yield f"retry: {EVENTS_RETRY_MS}\n\n"
+    idle = 0.0
+    # Skipped ids below the watermark are re-read until they show up or fall LOG_TAIL_GAP_WINDOW ids behind;
+    # ids lost to rolled-back inserts simply expire.
+    gaps: Set[int] = set()
+    while not await request.is_disconnected():
+        records = await run_in_threadpool(_read_logs, crud.tail_logs, after, sorted(gaps))
+        for record in records:
+            if record.id in gaps:
+                gaps.discard(record.id)
+            elif record.id > after:
+                gaps.update(range(max(after + 1, record.id - LOG_TAIL_GAP_WINDOW), record.id))
+                after = record.id
+            entry = schemas.LogEntry.model_validate(record, from_attributes=True)
+            # The event id is the watermark, so a reconnect resumes after it rather than after a late gap.
+            yield f"id: {after}\ndata: {entry.model_dump_json()}\n\n"
+        gaps = {gap for gap in gaps if gap > after - LOG_TAIL_GAP_WINDOW}
+        if records:
+            idle = 0.0
+            continue
+        await asyncio.sleep(LOG_TAIL_POLL_SECONDS)
+        idle += LOG_TAIL_POLL_SECONDS
+        if idle >= EVENTS_HEARTBEAT_SECONDS:
+            idle = 0.0
+            yield ": keepalive\n\n"
+
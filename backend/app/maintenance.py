@@ -0,0 +1,53 @@
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .logs import log_manager
+
+TICK_SECONDS = 5
+
+
+class MaintenanceRunner:
+    def __init__(self) -> None:
+        self._tasks: List[Tuple[str, float, Callable[[Session], None]]] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def register(self, name: str, interval_seconds: float, task: Callable[[Session], None]) -> None:
+        self._tasks.append((name, interval_seconds, task))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=TICK_SECONDS + 1)
+            self._thread = None
+
+    def _run(self) -> None:
+        next_run = {name: time.monotonic() for name, _, _ in self._tasks}
+        while not self._stop.wait(TICK_SECONDS):
+            now = time.monotonic()
+            for name, interval, task in self._tasks:
+                if now < next_run[name]:
+                    continue
+                next_run[name] = now + interval
+                db = SessionLocal()
+                try:
+                    task(db)
+                except Exception as exc:
+                    db.rollback()
+                    log_manager.add("ERROR", f"Maintenance task {name} failed: {exc}")
+                finally:
+                    db.close()
+
+
+maintenance = MaintenanceRunner()
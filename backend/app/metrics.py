@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .logs import log_manager
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_TOP_QUERIES = 5
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+EXPORT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            # Per series: one counter per bucket, then +Inf, then the sum.
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(key, le=_number(bound))} {_number(cumulative)}")
+            cumulative += values[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {_number(cumulative)}')
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(key)} {_number(cumulative)}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._series: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._series)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_labels(key)} {_number(value)}")
+        return lines
+
+
+def _labels(key: Labels, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+REQUEST_SECONDS = Histogram(
+    "obed_http_request_duration_seconds", "HTTP request latency by route and status.", LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "obed_http_request_db_queries", "SQL statements executed per HTTP request.", QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "obed_http_request_db_seconds", "Time spent in SQL statements per HTTP request.", LATENCY_BUCKETS
+)
+DB_QUERIES = Counter("obed_db_queries_total", "SQL statements executed, by route (background work is 'background').")
+EXPORT_SECONDS = Histogram("obed_export_render_seconds", "Report rendering time by format and outcome.", EXPORT_BUCKETS)
+
+REGISTRY = (REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, DB_QUERIES, EXPORT_SECONDS)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float) -> None:
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            totals = self.statements.setdefault(statement, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def breakdown(self, top: int = SLOW_REQUEST_TOP_QUERIES) -> str:
+        with self._lock:
+            ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return "; ".join(
+            f"{int(count)}x {seconds * 1000:.1f} ms {' '.join(statement.split())[:120]}"
+            for statement, (count, seconds) in ranked
+        )
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("obed_request_stats", default=None)
+_QUERY_START_KEY = "obed_query_start"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    connection.info.setdefault(_QUERY_START_KEY, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    starts = connection.info.get(_QUERY_START_KEY)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = _current.get()
+    if stats is None:
+        DB_QUERIES.inc(route="background")
+        return
+    stats.record(statement, elapsed)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=str(status))
+            REQUEST_QUERIES.observe(stats.queries, method=method, route=route)
+            REQUEST_DB_SECONDS.observe(stats.seconds, method=method, route=route)
+            DB_QUERIES.inc(stats.queries, route=route)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                log_manager.add(
+                    "WARN",
+                    f"Slow request {method} {route} {status}: {elapsed * 1000:.0f} ms, "
+                    f"{stats.queries} queries in {stats.seconds * 1000:.0f} ms. {stats.breakdown()}",
+                )
@@ -0,0 +1,337 @@
+import argparse
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection
+
+from . import crud, models, partitions
+from .database import Base, engine
+from .logs import log_manager
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+
+MIGRATIONS: List[Migration] = []
+
+# Tables that existed before versioned migrations; older deployments got them from create_all.
+BASELINE_TABLES = (
+    "users",
+    "employees",
+    "daily_participation",
+    "settings",
+    "data_version",
+    "idempotency_keys",
+    "webhook_events",
+    "log_entries",
+    "jobs",
+)
+LISTING_INDEXES = ("ix_employees_live_date_name_id", "ix_employees_participating_date")
+NATURAL_KEY_INDEX = "uq_employees_full_name_date"
+
+# The employees table as migrations 0001-0003 knew it; 0004 replaces it with people + attendance.
+# Migrations must not depend on the current models, which describe the schema after all of them.
+legacy_metadata = MetaData()
+legacy_employees = Table(
+    "employees",
+    legacy_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("full_name", String(255), nullable=False),
+    Column("status", Boolean),
+    Column("date", Date),
+    Column("note", String(255), nullable=True),
+    Column("version", BigInteger, nullable=False, server_default="0", index=True),
+    Column("updated_at", DateTime),
+    Column("deleted_at", DateTime, nullable=True),
+)
+Index(
+    "ix_employees_live_date_name_id",
+    legacy_employees.c.date.desc(),
+    legacy_employees.c.full_name,
+    legacy_employees.c.id,
+    postgresql_where=legacy_employees.c.deleted_at.is_(None),
+    sqlite_where=legacy_employees.c.deleted_at.is_(None),
+)
+Index(NATURAL_KEY_INDEX, legacy_employees.c.full_name, legacy_employees.c.date, unique=True)
+Index(
+    "ix_employees_participating_date",
+    legacy_employees.c.date,
+    postgresql_where=and_(legacy_employees.c.status.is_(True), legacy_employees.c.deleted_at.is_(None)),
+    sqlite_where=and_(legacy_employees.c.status.is_(True), legacy_employees.c.deleted_at.is_(None)),
+)
+
+
+def migration(version: int, name: str) -> Callable[[Callable[[Connection], None]], Callable[[Connection], None]]:
+    def register(fn: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        MIGRATIONS.append((version, name, fn))
+        return fn
+
+    return register
+
+
+def _add_missing_columns(connection: Connection, table: Table) -> None:
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        connection.execute(text(ddl))
+
+
+def _require_resync(connection: Connection) -> None:
+    # Synced clients may still hold removed rows, so every earlier version now requires a full resync.
+    data_version = models.DataVersion.__table__
+    current = select(data_version.c.id).where(data_version.c.id == crud.DATA_VERSION_ID)
+    if connection.execute(current).first() is None:
+        # Bootstrap creates the row only after migrations; without it the bump below would update nothing.
+        connection.execute(insert(data_version).values(id=crud.DATA_VERSION_ID, version=1, purged_version=0))
+    connection.execute(
+        update(data_version)
+        .where(data_version.c.id == crud.DATA_VERSION_ID)
+        .values(version=data_version.c.version + 1, purged_version=data_version.c.version + 1)
+    )
+
+
+def _recount_daily_totals(connection: Connection, table: Table, days: Optional[Sequence] = None) -> None:
+    totals = models.DailyParticipation.__table__
+    participating = func.sum(case((table.c.status.is_(True), 1), else_=0))
+    counts = (
+        select(table.c.date, participating, func.count(table.c.id) - participating)
+        .where(table.c.deleted_at.is_(None), table.c.date.is_not(None))
+        .group_by(table.c.date)
+    )
+    stale = delete(totals)
+    if days is not None:
+        counts = counts.where(table.c.date.in_(days))
+        stale = stale.where(totals.c.date.in_(days))
+    connection.execute(stale)
+    connection.execute(insert(totals).from_select(["date", "participants", "non_participants"], counts))
+
+
+def _resolve_missing_dates(connection: Connection, table: Table, key: Column) -> int:
+    # Undated records cannot be keyed, totalled or partitioned. Each is filed under the day it was last updated
+    # when its person has no record for that day yet; the rest are removed.
+    undated = connection.execute(
+        select(table.c.id, key, table.c.updated_at)
+        .where(table.c.date.is_(None))
+        .order_by(table.c.updated_at.desc(), table.c.id.desc())
+    ).all()
+    taken = set()
+    removed = []
+    for record_id, owner, updated_at in undated:
+        day = updated_at.date() if updated_at is not None else None
+        free = (
+            day is not None
+            and (owner, day) not in taken
+            and connection.execute(select(table.c.id).where(key == owner, table.c.date == day).limit(1)).first() is None
+        )
+        if free:
+            connection.execute(update(table).where(table.c.id == record_id).values(date=day))
+            taken.add((owner, day))
+        else:
+            removed.append(record_id)
+    if removed:
+        connection.execute(delete(table).where(table.c.id.in_(removed)))
+        _require_resync(connection)
+    if taken:
+        _recount_daily_totals(connection, table, sorted({day for _, day in taken}))
+    if undated:
+        log_manager.add(
+            "WARN", f"Dated {len(undated) - len(removed)} and removed {len(removed)} {table.name} rows without a date"
+        )
+    return len(removed)
+
+
+@migration(1, "baseline")
+def _baseline(connection: Connection) -> None:
+    tables = [Base.metadata.tables[name] for name in BASELINE_TABLES if name in Base.metadata.tables]
+    Base.metadata.create_all(bind=connection, tables=tables)
+    legacy_employees.create(connection, checkfirst=True)
+    for table in (models.User.__table__, legacy_employees, models.DataVersion.__table__):
+        _add_missing_columns(connection, table)
+        for index in table.indexes:
+            if index.name not in LISTING_INDEXES and index.name != NATURAL_KEY_INDEX:
+                index.create(connection, checkfirst=True)
+
+
+@migration(2, "employee listing indexes")
+def _employee_listing_indexes(connection: Connection) -> None:
+    for index in legacy_employees.indexes:
+        if index.name in LISTING_INDEXES:
+            index.create(connection, checkfirst=True)
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("ANALYZE employees"))
+
+
+@migration(3, "employee natural key")
+def _employee_natural_key(connection: Connection) -> None:
+    employees = legacy_employees
+    _resolve_missing_dates(connection, employees, employees.c.full_name)
+    # Per (full_name, date) keep the newest live row, or the newest tombstone when none is live.
+    ranked = select(
+        employees.c.id,
+        func.row_number()
+        .over(
+            partition_by=(employees.c.full_name, employees.c.date),
+            order_by=(case((employees.c.deleted_at.is_(None), 0), else_=1), employees.c.id.desc()),
+        )
+        .label("position"),
+    ).subquery()
+    duplicates = select(ranked.c.id).where(ranked.c.position > 1)
+    removed = connection.execute(delete(employees).where(employees.c.id.in_(duplicates))).rowcount
+    if removed:
+        _require_resync(connection)
+        _recount_daily_totals(connection, employees)
+        log_manager.add("WARN", f"Removed {removed} duplicate employee rows before adding the natural key")
+    for index in employees.indexes:
+        if index.name == NATURAL_KEY_INDEX:
+            index.create(connection, checkfirst=True)
+
+
+@migration(4, "people directory")
+def _people_directory(connection: Connection) -> None:
+    employees = legacy_employees
+    people = models.Person.__table__
+    attendance = models.Employee.__table__
+    people.create(connection, checkfirst=True)
+    attendance.create(connection, checkfirst=True)
+    connection.execute(
+        insert(people).from_select(
+            ["full_name", "created_at"],
+            select(employees.c.full_name, func.min(employees.c.updated_at)).group_by(employees.c.full_name),
+        )
+    )
+    # Record ids are kept, so API clients and synced copies keep pointing at the same records.
+    columns = ["id", "person_id", "status", "date", "note", "version", "updated_at", "deleted_at"]
+    connection.execute(
+        insert(attendance).from_select(
+            columns,
+            select(
+                employees.c.id,
+                people.c.id,
+                employees.c.status,
+                employees.c.date,
+                employees.c.note,
+                employees.c.version,
+                employees.c.updated_at,
+                employees.c.deleted_at,
+            ).join(people, people.c.full_name == employees.c.full_name),
+        )
+    )
+    employees.drop(connection)
+    if connection.dialect.name == "postgresql":
+        # Ids were copied explicitly, so the sequence has to be moved past them.
+        connection.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('attendance', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                "FROM attendance"
+            )
+        )
+        connection.execute(text("ANALYZE people"))
+        connection.execute(text("ANALYZE attendance"))
+
+
+@migration(5, "attendance partitions and archive")
+def _attendance_partitions(connection: Connection) -> None:
+    _add_missing_columns(connection, models.DataVersion.__table__)
+    models.AttendanceArchive.__table__.create(connection, checkfirst=True)
+    # The partition key cannot be NULL; rows left undated by the API are resolved the same way as in 0003.
+    attendance = models.Employee.__table__
+    _resolve_missing_dates(connection, attendance, attendance.c.person_id)
+    partitions.partition_attendance(connection)
+
+
+@migration(6, "idempotency request hash")
+def _idempotency_request_hash(connection: Connection) -> None:
+    _add_missing_columns(connection, models.IdempotencyKey.__table__)
+
+
+@migration(7, "log level names")
+def _log_level_names(connection: Connection) -> None:
+    # Entries written as WARNING by older releases; the rest of the code logs WARN.
+    log_entries = models.LogRecord.__table__
+    connection.execute(update(log_entries).where(log_entries.c.level == "WARNING").values(level="WARN"))
+
+
+def applied_versions() -> Dict[int, datetime]:
+    models.SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        rows = connection.execute(select(models.SchemaMigration.version, models.SchemaMigration.applied_at))
+        return {version: applied_at for version, applied_at in rows}
+
+
+def _stamp(connection: Connection, version: int, name: str) -> None:
+    connection.execute(
+        models.SchemaMigration.__table__.insert().values(version=version, name=name, applied_at=datetime.utcnow())
+    )
+
+
+def upgrade() -> List[str]:
+    applied = applied_versions()
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        fresh = not applied and not inspector.has_table("employees") and not inspector.has_table("attendance")
+    if fresh:
+        # An empty database gets the current models in one step and every migration is recorded as done.
+        with engine.begin() as connection:
+            Base.metadata.create_all(bind=connection)
+            partitions.partition_attendance(connection)
+            for version, name, _ in sorted(MIGRATIONS):
+                _stamp(connection, version, name)
+        log_manager.add("INFO", f"Created schema at migration {max(version for version, _, _ in MIGRATIONS)}")
+        return ["create schema"]
+
+    done: List[str] = []
+    for version, name, apply in sorted(MIGRATIONS):
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            apply(connection)
+            _stamp(connection, version, name)
+        log_manager.add("INFO", f"Applied migration {version:04d} {name}")
+        done.append(f"{version:04d} {name}")
+    return done
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description="Миграции схемы базы данных")
+    parser.add_argument("command", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        applied = applied_versions()
+        for version, name, _ in sorted(MIGRATIONS):
+            state = f"applied {applied[version]:%Y-%m-%d %H:%M:%S}" if version in applied else "pending"
+            print(f"{version:04d} {name}: {state}")
+        return 0
+
+    done = upgrade()
+    log_manager.flush()
+    print("\n".join(done) if done else "Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,109 @@
 from datetime import date, datetime
-from sqlalchemy import Boolean, Column, Date, DateTime, Float, Integer, String
+from sqlalchemy import (
+    JSON,
+    and_,
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+)
+from sqlalchemy.orm import relationship
 
 from .database import Base
 
 
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(100), unique=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class Person(Base):
+    __tablename__ = "people"
+
+    id = Column(Integer, primary_key=True)
+    full_name = Column(String(255), nullable=False, unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Employee(Base):
-    __tablename__ = "employees"
+    # One person's attendance on one day; the API still calls these records employees.
+    __tablename__ = "attendance"
 
-    id = Column(Integer, primary_key=True, index=True)
-    full_name = Column(String(255), nullable=False)
+    id = Column(Integer, primary_key=True)
+    person_id = Column(Integer, ForeignKey("people.id"), nullable=False)
     status = Column(Boolean, default=True)
-    date = Column(Date, default=date.today)
+    date = Column(Date, nullable=False, default=date.today)
     note = Column(String(255), nullable=True)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)
+
+    person = relationship(Person, lazy="joined", innerjoin=True)
+
+    __table_args__ = (
+        # Date range scans over live rows; names are joined from people afterwards.
+        Index(
+            "ix_attendance_live_date_person",
+            date.desc(),
+            person_id,
+            id,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        # Natural key: one record per person per day, also the index for per-person history.
+        # Deleted rows keep the key so a new write revives them.
+        Index("uq_attendance_person_date", person_id, date, unique=True),
+        Index(
+            "ix_attendance_participating_date",
+            date,
+            postgresql_where=and_(status.is_(True), deleted_at.is_(None)),
+            sqlite_where=and_(status.is_(True), deleted_at.is_(None)),
+        ),
+    )
+
+    @property
+    def full_name(self) -> str:
+        return self.person.full_name
+
+
+class AttendanceArchive(Base):
+    # One closed month per row: the month's records as gzip-compressed CSV, read back only by exports.
+    __tablename__ = "attendance_archive"
+
+    month = Column(Date, primary_key=True)
+    rows = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class DailyParticipation(Base):
+    __tablename__ = "daily_participation"
+
+    date = Column(Date, primary_key=True)
+    participants = Column(Integer, nullable=False, default=0)
+    non_participants = Column(Integer, nullable=False, default=0)
 
 
 class Settings(Base):
@@ -30,3 +112,64 @@ class Settings(Base):
     id = Column(Integer, primary_key=True, index=True)
     lunch_price = Column(Float, default=150.0)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DataVersion(Base):
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=1)
+    purged_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Months before this date are closed and live only in attendance_archive.
+    archived_before = Column(Date, nullable=True)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    # Hash of the request body; a key reused with a different body is rejected instead of replayed.
+    request_hash = Column(String(64), nullable=True)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    __table_args__ = (Index("ix_webhook_events_status_id", "status", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(16), nullable=False, default="pending")
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True, index=True)
+
+
+class LogRecord(Base):
+    __tablename__ = "log_entries"
+
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, nullable=False, index=True)
+    level = Column(String(16), nullable=False, index=True)
+    message = Column(Text, nullable=False)
+    pid = Column(Integer, nullable=True)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String(36), primary_key=True)
+    kind = Column(String(32), nullable=False)
+    status = Column(String(16), nullable=False, default="queued")
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    details = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,64 @@
+import base64
+import binascii
+import json
+from datetime import date
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import ColumnElement
+
+from . import models
+
+# Each sort is a tuple of (column, descending); the trailing id keeps the order total.
+SortKey = Tuple[Any, bool]
+
+EMPLOYEE_SORTS: Dict[str, Tuple[SortKey, ...]] = {
+    "date_desc": ((models.Employee.date, True), (models.Person.full_name, False), (models.Employee.id, False)),
+    "date_asc": ((models.Employee.date, False), (models.Person.full_name, False), (models.Employee.id, False)),
+    "name_asc": ((models.Person.full_name, False), (models.Employee.date, True), (models.Employee.id, False)),
+    "name_desc": ((models.Person.full_name, True), (models.Employee.date, True), (models.Employee.id, False)),
+}
+DEFAULT_SORT = "date_desc"
+
+
+class CursorError(ValueError):
+    pass
+
+
+def order_by(keys: Sequence[SortKey]) -> List[ColumnElement]:
+    return [column.desc() if descending else column.asc() for column, descending in keys]
+
+
+def after(keys: Sequence[SortKey], values: Sequence[Any]) -> ColumnElement:
+    clauses = []
+    for position, (column, descending) in enumerate(keys):
+        equal_prefix = [keys[index][0] == values[index] for index in range(position)]
+        step = column < values[position] if descending else column > values[position]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def row_values(keys: Sequence[SortKey], row: Any) -> List[Any]:
+    return [getattr(row, column.key) for column, _ in keys]
+
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    raw = [value.isoformat() if isinstance(value, date) else value for value in values]
+    payload = json.dumps({"s": sort, "v": raw}, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(sort: str, cursor: str, keys: Sequence[SortKey]) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort or len(payload["v"]) != len(keys):
+            raise CursorError("Курсор не соответствует сортировке")
+        return [
+            date.fromisoformat(value) if column.key == "date" else value
+            for (column, _), value in zip(keys, payload["v"])
+        ]
+    except CursorError:
+        raise
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise CursorError("Некорректный курсор") from exc
@@ -0,0 +1,151 @@
+import os
+from datetime import date
+from typing import Iterator, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+from .logs import log_manager
+
+PARENT = "attendance"
+DEFAULT_PARTITION = "attendance_default"
+PARTITION_LOCK_KEY = 7_310_002
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# PostgreSQL requires the partition key in every unique constraint, so the primary key becomes (id, date).
+# The mapped primary key stays id; ids still come from one sequence and stay unique.
+PARTITIONED_TABLE = f"""
+CREATE TABLE {PARENT} (
+    id INTEGER NOT NULL DEFAULT nextval('attendance_id_seq'),
+    person_id INTEGER NOT NULL REFERENCES people (id),
+    status BOOLEAN,
+    date DATE NOT NULL,
+    note VARCHAR(255),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    deleted_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date)
+"""
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months(first: date, last: date) -> Iterator[date]:
+    month, last = month_start(first), month_start(last)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_y{month:%Y}m{month:%m}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name))"),
+        {"name": PARENT},
+    ).scalar_one()
+
+
+def existing_partitions(connection: Connection) -> Set[str]:
+    rows = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:name)"
+        ),
+        {"name": PARENT},
+    )
+    return {name for name, in rows}
+
+
+def add_partition(connection: Connection, month: date, existing: Set[str]) -> bool:
+    name = partition_name(month)
+    if name in existing:
+        return False
+    start, end = month, add_months(month, 1)
+    # Rows for the month may already sit in the default partition; attaching would fail until they move out.
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)"))
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    connection.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    existing.add(name)
+    return True
+
+
+def drop_partition(connection: Connection, month: date) -> bool:
+    name = partition_name(month)
+    if not is_partitioned(connection) or name not in existing_partitions(connection):
+        return False
+    connection.execute(text(f"DROP TABLE {name}"))
+    return True
+
+
+def partition_attendance(connection: Connection) -> None:
+    # create_all cannot express this table, so the plain one is rebuilt as a partitioned table and refilled.
+    if connection.dialect.name != "postgresql" or is_partitioned(connection):
+        return
+    connection.execute(text(f"ALTER TABLE {PARENT} RENAME TO {PARENT}_unpartitioned"))
+    connection.execute(
+        text(f"ALTER TABLE {PARENT}_unpartitioned RENAME CONSTRAINT {PARENT}_pkey TO {PARENT}_unpartitioned_pkey")
+    )
+    indexes = models.Employee.__table__.indexes
+    for index in indexes:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    connection.execute(text(PARTITIONED_TABLE))
+    # The sequence moves to the new table, so ids continue where they were.
+    connection.execute(text(f"ALTER SEQUENCE {PARENT}_id_seq OWNED BY {PARENT}.id"))
+    for index in indexes:
+        index.create(connection)
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+
+    today = date.today()
+    first = connection.execute(text(f"SELECT min(date) FROM {PARENT}_unpartitioned")).scalar() or today
+    existing: Set[str] = set()
+    for month in months(first, add_months(month_start(today), PARTITION_MONTHS_AHEAD)):
+        add_partition(connection, month, existing)
+    # Migration 0005 has already resolved undated rows, so every row has a partition to go to.
+    connection.execute(
+        text(
+            f"INSERT INTO {PARENT} (id, person_id, status, date, note, version, updated_at, deleted_at) "
+            f"SELECT id, person_id, status, date, note, version, updated_at, deleted_at FROM {PARENT}_unpartitioned"
+        )
+    )
+    connection.execute(text(f"DROP TABLE {PARENT}_unpartitioned"))
+    connection.execute(text(f"ANALYZE {PARENT}"))
+
+
+def ensure_partitions(db: Session) -> int:
+    # Keeps partitions a few months ahead and splits months that landed in the default partition.
+    connection = db.connection()
+    if not is_partitioned(connection):
+        return 0
+    # Every worker runs maintenance; the transaction-scoped lock lets only one of them add partitions at a time.
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    existing = existing_partitions(connection)
+    current = month_start(date.today())
+    wanted = set(months(current, add_months(current, PARTITION_MONTHS_AHEAD)))
+    stray = connection.execute(text(f"SELECT DISTINCT date_trunc('month', date)::date FROM {DEFAULT_PARTITION}"))
+    wanted.update(month for month, in stray)
+    added = sum(add_partition(connection, month, existing) for month in sorted(wanted))
+    db.commit()
+    if added:
+        log_manager.add("INFO", f"Added {added} attendance partitions")
+    return added
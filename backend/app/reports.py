@@ -0,0 +1,196 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from . import archive, crud, exporter, metrics
+from .database import SessionLocal
+from .logs import log_manager
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "obed-exports"))
+EXPORT_CACHE_TTL = int(os.getenv("EXPORT_CACHE_TTL", "900"))
+
+EXPORT_JOB_KIND = "export"
+FORMATS = {
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": ("pdf", "application/pdf"),
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps children free of the parent's threads and pooled DB connections
+            _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def filename(fmt: str, start: date, end: date) -> str:
+    return f"employees_{start}_{end}.{FORMATS[fmt][0]}"
+
+
+def artifact_path(fmt: str, start: date, end: date, include_price: bool, price: float, version: int) -> str:
+    key = hashlib.sha1(f"{fmt}|{start}|{end}|{include_price}|{price}|{version}".encode()).hexdigest()
+    return os.path.join(EXPORT_CACHE_DIR, f"{key}.{FORMATS[fmt][0]}")
+
+
+def is_fresh(path: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) < EXPORT_CACHE_TTL
+    except OSError:
+        return False
+
+
+def evict_expired() -> None:
+    try:
+        names = os.listdir(EXPORT_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    now = time.time()
+    for name in names:
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) >= EXPORT_CACHE_TTL:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def render(
+    fmt: str,
+    start: date,
+    end: date,
+    include_price: bool,
+    price: float,
+    version: int,
+    path: str,
+    job_id: Optional[str] = None,
+) -> str:
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.part"
+    db = crud.open_read_session(version)
+    try:
+        if job_id is not None:
+            _mark_running(job_id)
+        _write_report(db, fmt, start, end, include_price, price, partial)
+        os.replace(partial, path)
+    except Exception as exc:
+        # Library exceptions are not always picklable and would break the pool on the way back.
+        raise RuntimeError(str(exc)) from None
+    finally:
+        db.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        # Pool children never start the flusher thread, so their entries are written here or not at all.
+        log_manager.flush()
+    return path
+
+
+def _mark_running(job_id: str) -> None:
+    db = SessionLocal()
+    try:
+        job = crud.get_job(db, job_id, EXPORT_JOB_KIND)
+        if job is not None and job.status == "queued":
+            job.status = "running"
+            db.commit()
+    finally:
+        db.close()
+
+
+def _write_report(db: Session, fmt: str, start: date, end: date, include_price: bool, price: float, partial: str) -> None:
+    with open(partial, "wb") as output:
+        _, total_cost = crud.aggregate_cost(db, start, end)
+        if fmt == "excel":
+            exporter.write_excel(archive.iter_employees(db, start, end), include_price, price, total_cost, output)
+        else:
+            employees = list(archive.iter_employees(db, start, end))
+            output.write(exporter.export_pdf(employees, include_price, price, total_cost))
+
+
+def submit(
+    fmt: str, start: date, end: date, include_price: bool, price: float, version: int, job_id: Optional[str] = None
+) -> Future:
+    evict_expired()
+    path = artifact_path(fmt, start, end, include_price, price, version)
+    if is_fresh(path):
+        future: Future = Future()
+        future.set_result(path)
+        return future
+    started = time.perf_counter()
+    try:
+        future = _get_pool().submit(render, fmt, start, end, include_price, price, version, path, job_id)
+    except BrokenProcessPool:
+        shutdown()
+        future = _get_pool().submit(render, fmt, start, end, include_price, price, version, path, job_id)
+    future.add_done_callback(lambda done: _observe_render(fmt, started, done))
+    return future
+
+
+def _observe_render(fmt: str, started: float, future: Future) -> None:
+    outcome = "error" if future.cancelled() or future.exception() is not None else "ok"
+    metrics.EXPORT_SECONDS.observe(time.perf_counter() - started, format=fmt, outcome=outcome)
+
+
+def start_job(
+    job_id: str, fmt: str, start: date, end: date, include_price: bool, price: float, version: int
+) -> None:
+    try:
+        future = submit(fmt, start, end, include_price, price, version, job_id)
+    except Exception as exc:
+        # The job row is already committed as queued; without this it would stay queued forever.
+        _fail_job(job_id, exc)
+        return
+    future.add_done_callback(lambda done: _finish_job(job_id, done))
+
+
+def _fail_job(job_id: str, exc: BaseException) -> None:
+    db = SessionLocal()
+    try:
+        job = crud.get_job(db, job_id, EXPORT_JOB_KIND)
+        if job is not None:
+            crud.finish_job(db, job, "failed", f"Ошибка формирования отчета: {exc}")
+        log_manager.add("ERROR", f"Экспорт {job_id} не выполнен: {exc}")
+    finally:
+        db.close()
+
+
+def _finish_job(job_id: str, future: Future) -> None:
+    # Pending renders are cancelled when the pool shuts down; their jobs must not stay queued either.
+    exc = RuntimeError("экспорт отменен") if future.cancelled() else future.exception()
+    if exc is not None:
+        _fail_job(job_id, exc)
+        return
+    db = SessionLocal()
+    try:
+        job = crud.get_job(db, job_id, EXPORT_JOB_KIND)
+        if job is None:
+            return
+        job.details = {**(job.details or {}), "path": future.result()}
+        crud.finish_job(db, job, "completed")
+    finally:
+        db.close()
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional speedup
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+EMPLOYEE_FIELDS = ("id", "full_name", "status", "date", "note")
+
+
+def rows_to_dicts(rows: Iterable[Sequence[Any]], fields: Sequence[str] = EMPLOYEE_FIELDS) -> List[Dict[str, Any]]:
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in {"0", "0.0", "0.00", "0.000"}:
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def compress(request: Request, body: bytes, headers: Dict[str, str]) -> bytes:
+    headers["Vary"] = "Accept-Encoding"
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    if brotli is not None and "br" in accepted:
+        headers["Content-Encoding"] = "br"
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if "gzip" in accepted or "*" in accepted:
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def json_response(request: Request, payload: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    # Bypasses response_model validation: callers build the payload from trusted DB columns.
+    headers = dict(headers or {})
+    body = compress(request, dumps(payload), headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,7 +1,8 @@
+import datetime as dt
 from datetime import date, datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class Token(BaseModel):
@@ -42,9 +43,18 @@ class EmployeeCreate(EmployeeBase):
 class EmployeeUpdate(BaseModel):
     full_name: Optional[str] = None
     status: Optional[bool] = None
-    date: Optional[date] = None
+    # dt.date: inside the class body a plain "date" would resolve to this field's own default.
+    date: Optional[dt.date] = None
     note: Optional[str] = None
 
+    # Omitting date keeps it; an explicit null would leave the record without a day.
+    @field_validator("date")
+    @classmethod
+    def date_not_null(cls, value: Optional[dt.date]) -> dt.date:
+        if value is None:
+            raise ValueError("date cannot be null")
+        return value
+
 
 class Employee(EmployeeBase):
     id: int
@@ -52,28 +62,189 @@ class Employee(EmployeeBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class EmployeeBulkUpdate(BaseModel):
+    ids: Optional[List[int]] = Field(default=None, max_length=10000)
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    full_names: Optional[List[str]] = Field(default=None, max_length=10000)
+    status: Optional[bool] = None
+    note: Optional[str] = None
+
+
+class EmployeeBulkUpdateResponse(BaseModel):
+    updated: int
+
+
+class RosterCopyRequest(BaseModel):
+    source_date: date
+    target_date: date
+    overwrite: bool = False
+
+
+class RosterCopyResponse(BaseModel):
+    copied: int
+    skipped: int
+
+
 class EmployeeListResponse(BaseModel):
+    version: int
     employees: List[Employee]
     lunch_price: float
     total_participants: int
     total_cost: float
 
 
+class EmployeeChange(Employee):
+    version: int
+    deleted: bool = False
+
+
+class EmployeeChangesResponse(BaseModel):
+    version: int
+    changes: List[EmployeeChange]
+    has_more: bool
+    next_since: int
+    next_after_id: int
+
+
+class EmployeePage(BaseModel):
+    employees: List[Employee]
+    next_cursor: Optional[str] = None
+    lunch_price: float
+    # Filled on the first page only (no cursor); later pages leave them null.
+    total_count: Optional[int] = None
+    total_participants: Optional[int] = None
+    total_cost: Optional[float] = None
+
+
+class DailySummary(BaseModel):
+    date: date
+    participants: int
+    non_participants: int
+    total_cost: float
+
+
+class DailySummaryResponse(BaseModel):
+    days: List[DailySummary]
+    lunch_price: float
+    total_participants: int
+    total_cost: float
+
+
+class MonthlySummary(BaseModel):
+    month: str
+    participants: int
+    non_participants: int
+    total_cost: float
+
+
+class MonthlySummaryResponse(BaseModel):
+    months: List[MonthlySummary]
+    lunch_price: float
+    total_participants: int
+    total_cost: float
+
+
+class Person(BaseModel):
+    id: int
+    full_name: str
+
+
+class AttendanceRecord(BaseModel):
+    id: int
+    date: date
+    status: bool
+    note: Optional[str] = None
+
+
+class PersonHistoryResponse(BaseModel):
+    person: Person
+    records: List[AttendanceRecord]
+    lunch_price: float
+    total_participants: int
+    total_cost: float
+
+
+class ImportRejection(BaseModel):
+    row: int
+    error: str
+
+
+class ImportJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total_rows: int = 0
+    processed_rows: int = 0
+    imported: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+    rejections: List[ImportRejection] = []
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
 class ExportRequest(BaseModel):
     start_date: date
     end_date: date
     include_price: bool = True
+    format: Literal["excel", "pdf"] = "excel"
 
 
-class WebhookPayload(BaseModel):
-    secret: str
+class ExportJobResponse(BaseModel):
+    job_id: str
+    status: str
+    format: str
+    filename: str
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class WebhookAction(BaseModel):
     action: str
     employee: Optional[EmployeeCreate] = None
     employee_id: Optional[int] = None
     update: Optional[EmployeeUpdate] = None
 
 
+class WebhookPayload(WebhookAction):
+    secret: str
+
+
+class WebhookBatchPayload(BaseModel):
+    secret: str
+    idempotency_key: Optional[str] = Field(default=None, max_length=255)
+    actions: List[WebhookAction] = Field(min_length=1, max_length=1000)
+
+
+class WebhookQueueStats(BaseModel):
+    mode: str
+    pending: int
+    failed: int
+    oldest_pending_at: Optional[datetime] = None
+    lag_seconds: float
+    last_processed_at: Optional[datetime] = None
+
+
+class WebhookBatchItemResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class WebhookBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    created: int = 0
+    updated: int = 0
+    results: List[WebhookBatchItemResult]
+
+
 class LogEntry(BaseModel):
+    id: Optional[int] = None
     timestamp: datetime
     level: str
     message: str
@@ -81,3 +252,4 @@ class LogEntry(BaseModel):
 
 class LogResponse(BaseModel):
     entries: List[LogEntry]
+    next_cursor: Optional[int] = None
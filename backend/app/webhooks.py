@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+from .database import SessionLocal
+from .events import broker
+from .logs import log_manager
+
+# "sync" applies webhooks inside the request, "queue" stores them and answers 202 right away.
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "sync").lower()
+WEBHOOK_QUEUE_BATCH_SIZE = int(os.getenv("WEBHOOK_QUEUE_BATCH_SIZE", "500"))
+WEBHOOK_QUEUE_POLL_SECONDS = float(os.getenv("WEBHOOK_QUEUE_POLL_SECONDS", "1"))
+
+QUEUE_MODE = "queue"
+
+Group = Tuple[schemas.WebhookAction, List[models.WebhookEvent]]
+
+
+def is_queue_mode() -> bool:
+    return WEBHOOK_MODE == QUEUE_MODE
+
+
+def check_action(payload: schemas.WebhookAction) -> str:
+    action = payload.action.lower()
+    if action == "add" and not payload.employee:
+        raise HTTPException(status_code=400, detail="Нет данных сотрудника для добавления")
+    if action == "update" and (not payload.employee_id or not payload.update):
+        raise HTTPException(status_code=400, detail="Необходимо указать employee_id и update")
+    if action == "delete" and not payload.employee_id:
+        raise HTTPException(status_code=400, detail="Необходимо указать employee_id")
+    if action not in ("add", "update", "delete"):
+        raise HTTPException(status_code=400, detail="Неизвестное действие")
+    return action
+
+
+def apply_action(db: Session, payload: schemas.WebhookAction, commit: bool = True) -> Dict[str, object]:
+    action = check_action(payload)
+    try:
+        if action == "add":
+            # Retried deliveries hit the (full_name, date) key and update the record instead of duplicating it.
+            employee, created = crud.upsert_employee(db, payload.employee, commit=commit)
+            return {"status": "added" if created else "updated", "id": employee.id}
+        if action == "update":
+            employee = crud.update_employee(db, payload.employee_id, payload.update, commit=commit)
+            return {"status": "updated", "id": employee.id}
+        crud.delete_employee(db, payload.employee_id, commit=commit)
+    except crud.DuplicateEmployeeError as exc:
+        raise HTTPException(status_code=409, detail="Запись для этого сотрудника на эту дату уже существует") from exc
+    except crud.ArchivedPeriodError as exc:
+        raise HTTPException(status_code=409, detail="Период закрыт и перенесен в архив") from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    return {"status": "deleted", "id": payload.employee_id}
+
+
+def request_hash(actions: List[schemas.WebhookAction]) -> str:
+    body = [action.model_dump(mode="json", exclude_unset=True) for action in actions]
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def apply_batch(
+    db: Session, actions: List[schemas.WebhookAction], key: Optional[str]
+) -> Tuple[Union[schemas.WebhookBatchResponse, Dict], bool]:
+    digest = request_hash(actions) if key else None
+    if key:
+        stored = crud.get_idempotent_response(db, key, digest)
+        if stored is not None:
+            return stored, True
+
+    results = []
+    for index, action in enumerate(actions):
+        mark = broker.pending_mark(db)
+        savepoint = db.begin_nested()
+        try:
+            outcome = apply_action(db, action, commit=False)
+        except HTTPException as exc:
+            savepoint.rollback()
+            broker.discard_after(db, mark)
+            results.append(schemas.WebhookBatchItemResult(index=index, status="error", detail=str(exc.detail)))
+            continue
+        except SQLAlchemyError as exc:
+            # Only this item's savepoint is lost; the rest of the batch still commits.
+            savepoint.rollback()
+            broker.discard_after(db, mark)
+            log_manager.add("ERROR", f"Webhook batch item {index} failed: {exc}")
+            results.append(schemas.WebhookBatchItemResult(index=index, status="error", detail="Ошибка базы данных"))
+            continue
+        savepoint.commit()
+        results.append(schemas.WebhookBatchItemResult(index=index, status=outcome["status"], id=outcome["id"]))
+    failed = sum(1 for result in results if result.status == "error")
+    batch_response = schemas.WebhookBatchResponse(
+        applied=len(results) - failed,
+        failed=failed,
+        created=sum(1 for result in results if result.status == "added"),
+        updated=sum(1 for result in results if result.status == "updated"),
+        results=results,
+    )
+
+    if key:
+        crud.store_idempotent_response(db, key, batch_response.model_dump(mode="json"), digest)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent delivery with the same key committed first; answer with its result.
+        db.rollback()
+        stored = crud.get_idempotent_response(db, key, digest) if key else None
+        if stored is None:
+            raise
+        return stored, True
+    log_manager.add("INFO", f"Пакет webhook: применено {batch_response.applied}, ошибок {failed}")
+    return batch_response, False
+
+
+def enqueue(db: Session, payload: schemas.WebhookAction) -> models.WebhookEvent:
+    check_action(payload)
+    event = crud.enqueue_webhook_event(db, payload.model_dump(mode="json", exclude_unset=True))
+    worker.wake()
+    return event
+
+
+def coalesce(events: List[models.WebhookEvent]) -> List[Group]:
+    # Consecutive updates of one employee collapse into a single write; a delete supersedes them.
+    groups: List[Group] = []
+    open_updates: Dict[int, int] = {}
+    for event in events:
+        action = schemas.WebhookAction.model_validate(event.payload)
+        kind = action.action.lower()
+        index = open_updates.get(action.employee_id) if action.employee_id else None
+        if kind == "update" and action.update is not None and index is not None:
+            merged, members = groups[index]
+            fields = {
+                **merged.update.model_dump(exclude_unset=True),
+                **action.update.model_dump(exclude_unset=True),
+            }
+            groups[index] = (merged.model_copy(update={"update": schemas.EmployeeUpdate(**fields)}), members + [event])
+            continue
+        if kind == "delete" and index is not None:
+            open_updates.pop(action.employee_id)
+            groups[index] = (action, groups[index][1] + [event])
+            continue
+        if kind == "update" and action.employee_id and action.update is not None:
+            open_updates[action.employee_id] = len(groups)
+        groups.append((action, [event]))
+    return groups
+
+
+def drain(db: Session, limit: int = WEBHOOK_QUEUE_BATCH_SIZE) -> int:
+    events = crud.claim_webhook_events(db, limit)
+    if not events:
+        db.commit()
+        return 0
+    applied = failed = 0
+    for action, members in coalesce(events):
+        mark = broker.pending_mark(db)
+        savepoint = db.begin_nested()
+        try:
+            result: Optional[Dict[str, object]] = apply_action(db, action, commit=False)
+            error = None
+        except HTTPException as exc:
+            savepoint.rollback()
+            broker.discard_after(db, mark)
+            result, error = None, str(exc.detail)
+        except Exception as exc:
+            savepoint.rollback()
+            broker.discard_after(db, mark)
+            result, error = None, str(exc)
+        else:
+            savepoint.commit()
+        now = datetime.utcnow()
+        for event in members:
+            event.status = "failed" if error else "applied"
+            event.result = result
+            event.error = error
+            event.processed_at = now
+        if error:
+            failed += len(members)
+        else:
+            applied += len(members)
+    db.commit()
+    log_manager.add("INFO", f"Webhook queue drained: {applied} applied, {failed} failed")
+    return len(events)
+
+
+class WebhookQueueWorker:
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not is_queue_mode() or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="webhook-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=WEBHOOK_QUEUE_POLL_SECONDS + 5)
+            self._thread = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(WEBHOOK_QUEUE_POLL_SECONDS)
+            self._wake.clear()
+            claimed = WEBHOOK_QUEUE_BATCH_SIZE
+            # Keep draining while batches come back full so a backlog is cleared without waiting for the poll.
+            while claimed >= WEBHOOK_QUEUE_BATCH_SIZE and not self._stop.is_set():
+                db = SessionLocal()
+                try:
+                    claimed = drain(db)
+                except Exception as exc:
+                    db.rollback()
+                    claimed = 0
+                    log_manager.add("ERROR", f"Webhook queue drain failed: {exc}")
+                finally:
+                    db.close()
+
+
+worker = WebhookQueueWorker()
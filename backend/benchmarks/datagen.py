@@ -0,0 +1,156 @@
+import random
+from datetime import date, timedelta
+from io import BytesIO
+from typing import Dict, Iterator, List, Sequence
+
+from openpyxl import Workbook
+
+# (masculine, feminine)
+SURNAMES = [
+    ("Иванов", "Иванова"),
+    ("Смирнов", "Смирнова"),
+    ("Кузнецов", "Кузнецова"),
+    ("Попов", "Попова"),
+    ("Васильев", "Васильева"),
+    ("Петров", "Петрова"),
+    ("Соколов", "Соколова"),
+    ("Михайлов", "Михайлова"),
+    ("Новиков", "Новикова"),
+    ("Фёдоров", "Фёдорова"),
+    ("Морозов", "Морозова"),
+    ("Волков", "Волкова"),
+    ("Алексеев", "Алексеева"),
+    ("Лебедев", "Лебедева"),
+    ("Семёнов", "Семёнова"),
+    ("Егоров", "Егорова"),
+    ("Павлов", "Павлова"),
+    ("Козлов", "Козлова"),
+    ("Степанов", "Степанова"),
+    ("Николаев", "Николаева"),
+    ("Орлов", "Орлова"),
+    ("Андреев", "Андреева"),
+    ("Макаров", "Макарова"),
+    ("Никитин", "Никитина"),
+    ("Захаров", "Захарова"),
+    ("Зайцев", "Зайцева"),
+    ("Соловьёв", "Соловьёва"),
+    ("Борисов", "Борисова"),
+    ("Яковлев", "Яковлева"),
+    ("Григорьев", "Григорьева"),
+    ("Романов", "Романова"),
+    ("Воробьёв", "Воробьёва"),
+    ("Сергеев", "Сергеева"),
+    ("Кузьмин", "Кузьмина"),
+    ("Фролов", "Фролова"),
+    ("Белый", "Белая"),
+    ("Тарасов", "Тарасова"),
+    ("Белов", "Белова"),
+    ("Комаров", "Комарова"),
+    ("Жуков", "Жукова"),
+]
+
+MALE_NAMES = [
+    "Александр", "Алексей", "Андрей", "Артём", "Борис", "Вадим", "Виктор", "Владимир", "Дмитрий", "Евгений",
+    "Иван", "Игорь", "Илья", "Кирилл", "Константин", "Максим", "Михаил", "Никита", "Николай", "Олег",
+    "Павел", "Роман", "Сергей", "Степан", "Юрий",
+]
+
+FEMALE_NAMES = [
+    "Александра", "Алина", "Анастасия", "Анна", "Валентина", "Вера", "Виктория", "Галина", "Дарья", "Екатерина",
+    "Елена", "Ирина", "Ксения", "Лариса", "Любовь", "Марина", "Мария", "Наталья", "Ольга", "Полина",
+    "Светлана", "Софья", "Татьяна", "Юлия", "Ярослава",
+]
+
+# (masculine, feminine)
+PATRONYMICS = [
+    ("Александрович", "Александровна"),
+    ("Алексеевич", "Алексеевна"),
+    ("Андреевич", "Андреевна"),
+    ("Борисович", "Борисовна"),
+    ("Викторович", "Викторовна"),
+    ("Владимирович", "Владимировна"),
+    ("Дмитриевич", "Дмитриевна"),
+    ("Евгеньевич", "Евгеньевна"),
+    ("Иванович", "Ивановна"),
+    ("Игоревич", "Игоревна"),
+    ("Ильич", "Ильинична"),
+    ("Константинович", "Константиновна"),
+    ("Михайлович", "Михайловна"),
+    ("Николаевич", "Николаевна"),
+    ("Олегович", "Олеговна"),
+    ("Павлович", "Павловна"),
+    ("Петрович", "Петровна"),
+    ("Сергеевич", "Сергеевна"),
+    ("Юрьевич", "Юрьевна"),
+]
+
+NOTES = ["Удаленно", "Командировка", "Без хлеба", "Вегетарианское меню", "Поздний обед", "Гость"]
+NOTE_RATE = 0.05
+
+COLUMN_NAME = "Ф.И.О"
+COLUMN_STATUS = "Статус"
+COLUMN_DATE = "Дата"
+COLUMN_NOTE = "Примечание"
+
+
+def full_names(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    names: List[str] = []
+    seen = set()
+    while len(names) < count:
+        female = rng.random() < 0.5
+        surname = rng.choice(SURNAMES)[female]
+        first = rng.choice(FEMALE_NAMES if female else MALE_NAMES)
+        patronymic = rng.choice(PATRONYMICS)[female]
+        name = f"{surname} {first} {patronymic}"
+        if name in seen:
+            # Rosters larger than the name pool still need distinct people.
+            name = f"{name} ({len(names)})"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def workdays(start: date, count: int) -> List[date]:
+    days: List[date] = []
+    current = start
+    while len(days) < count:
+        if current.weekday() < 5:
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def roster(
+    employees: int, days: int, start: date, seed: int = 0, participation: float = 0.8
+) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    names = full_names(employees, seed)
+    for day in workdays(start, days):
+        for name in names:
+            note = rng.choice(NOTES) if rng.random() < NOTE_RATE else None
+            yield {"full_name": name, "status": rng.random() < participation, "date": day, "note": note}
+
+
+def roster_rows(rows: int, start: date, seed: int = 0, employees: int = 500) -> List[Dict]:
+    employees = max(1, min(employees, rows))
+    days = -(-rows // employees)
+    return list(roster(employees, days, start, seed))[:rows]
+
+
+def workbook(rows: Sequence[Dict]) -> bytes:
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet("Сотрудники")
+    sheet.append([COLUMN_NAME, COLUMN_STATUS, COLUMN_DATE, COLUMN_NOTE])
+    for row in rows:
+        sheet.append(
+            [
+                row["full_name"],
+                "Участвует" if row["status"] else "Не участвует",
+                row["date"].isoformat(),
+                row["note"],
+            ]
+        )
+    output = BytesIO()
+    book.save(output)
+    return output.getvalue()
@@ -0,0 +1,103 @@
+import argparse
+import os
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+from . import datagen
+
+INDEX_PREFIXES = ("ix_attendance_", "uq_attendance_")
+EXPLAIN_EMPLOYEES = 50
+EXPLAIN_DAYS = 22
+
+
+def _capture(db, call: Callable[[], object]) -> List[Tuple[str, object]]:
+    from sqlalchemy import event
+
+    statements: List[Tuple[str, object]] = []
+
+    def record(connection, cursor, statement, parameters, context, executemany) -> None:
+        if "FROM attendance" in statement:
+            statements.append((statement, parameters))
+
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        result = call()
+        if hasattr(result, "__next__"):
+            list(result)
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+    return statements
+
+
+def _plan(db, statement: str, parameters: object) -> List[str]:
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        # The check is whether the planner *can* use the index; on a small table it would rightly prefer a scan.
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).all()
+        return [row[0] for row in rows]
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def _problems(dialect: str, plan: List[str], ordered: bool) -> List[str]:
+    text = "\n".join(plan)
+    problems = []
+    if dialect == "postgresql":
+        # Monthly partitions carry copies of the indexes under generated names (attendance_y2024m01_..._idx).
+        if not any(prefix in text for prefix in INDEX_PREFIXES) and "Index" not in text:
+            problems.append("no attendance index used")
+        if "Seq Scan on attendance" in text:
+            problems.append("sequential scan")
+    else:
+        if not any(prefix in text for prefix in INDEX_PREFIXES):
+            problems.append("no attendance index used")
+        if any(line.strip() == "SCAN attendance" for line in plan):
+            problems.append("full table scan")
+        if ordered and "USE TEMP B-TREE FOR ORDER BY" in text:
+            problems.append("sort not served by the index")
+    return problems
+
+
+def explain(args: argparse.Namespace) -> int:
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'obed-explain.db')}"
+    if args.database_url is None and os.path.exists(url.split("///", 1)[-1]):
+        os.remove(url.split("///", 1)[-1])
+    os.environ["DATABASE_URL"] = url
+
+    from sqlalchemy import select
+
+    from app import bootstrap, crud, models
+    from app.database import SessionLocal
+
+    from .run import ROSTER_START, _seed
+
+    bootstrap.run()
+    db = SessionLocal()
+    try:
+        if db.execute(select(models.Employee.id).limit(1)).first() is None:
+            _seed(EXPLAIN_EMPLOYEES, EXPLAIN_DAYS, 0)
+        days = datagen.workdays(ROSTER_START, EXPLAIN_DAYS)
+        start, end = days[-5], days[-1]
+        hot: Dict[str, Callable[[], object]] = {
+            "list range": lambda: crud.list_employees(db, start, end),
+            "list all": lambda: crud.list_employees(db),
+            "page first": lambda: crud.page_employees(db, limit=50, start=start, end=end),
+            "page participating": lambda: crud.page_employees(db, limit=50, start=start, end=end, status=True),
+            "export rows": lambda: crud.iter_employees(db, start, end),
+            "person history": lambda: crud.person_history(db, 1, start, end),
+        }
+        failures = 0
+        for name, call in hot.items():
+            for statement, parameters in _capture(db, call):
+                plan = _plan(db, statement, parameters)
+                problems = _problems(db.bind.dialect.name, plan, "ORDER BY" in statement)
+                failures += bool(problems)
+                print(f"[{'FAIL' if problems else 'ok'}] {name}: {' | '.join(line.strip() for line in plan)}")
+                for problem in problems:
+                    print(f"       {problem}")
+        db.rollback()
+    finally:
+        db.close()
+    return 1 if failures else 0
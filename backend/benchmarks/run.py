@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+from . import datagen
+
+DEFAULT_EMPLOYEES = 500
+DEFAULT_DAYS = 66
+DEFAULT_IMPORT_SIZES = "1000,10000,100000"
+DEFAULT_REPEAT = 5
+DEFAULT_WEBHOOK_COUNT = 200
+DEFAULT_WEBHOOK_BATCH = 500
+DEFAULT_THRESHOLD = 0.1
+SEED_CHUNK = 10_000
+ROSTER_START = date(2024, 1, 1)
+# Imports and webhooks write into their own dates so they never change what the read benchmarks see.
+WRITE_START = date(2030, 1, 1)
+
+SCHEMA = 1
+
+
+def _percentile(samples: Sequence[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _result(name: str, samples: List[float], items: int = 1, params: Optional[Dict] = None, error: str = "") -> Dict:
+    result: Dict = {"name": name, "params": params or {}, "items": items, "runs": len(samples), "samples": samples}
+    if samples:
+        median = statistics.median(samples)
+        result.update(
+            min=min(samples),
+            median=median,
+            mean=statistics.fmean(samples),
+            p95=_percentile(samples, 0.95),
+            max=max(samples),
+            items_per_second=items / median if median else None,
+        )
+    if error:
+        result["error"] = error
+    return result
+
+
+def _measure(name: str, runs: int, call: Callable[[], None], items: int = 1, params: Optional[Dict] = None) -> Dict:
+    samples: List[float] = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception as exc:
+            return _result(name, samples, items, params, error=str(exc))
+        samples.append(time.perf_counter() - started)
+    return _result(name, samples, items, params)
+
+
+def _check(response) -> None:
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+def _git_revision() -> Dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def _prepare_database(url: str, reset: bool) -> None:
+    from sqlalchemy import create_engine, inspect, text
+
+    if url.startswith("sqlite") and reset:
+        path = url.split("///", 1)[-1]
+        if path and os.path.exists(path):
+            os.remove(path)
+        return
+    probe = create_engine(url)
+    try:
+        tables = inspect(probe).get_table_names()
+        if reset:
+            from app.database import Base
+            from app import models  # noqa: F401
+
+            Base.metadata.drop_all(bind=probe)
+            return
+        if "attendance" in tables:
+            with probe.connect() as connection:
+                if connection.execute(text("SELECT 1 FROM attendance LIMIT 1")).first():
+                    sys.exit("База уже содержит данные; запустите с --reset, чтобы пересоздать схему")
+    finally:
+        probe.dispose()
+
+
+def _seed(employees: int, days: int, seed: int) -> int:
+    from app import crud
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    total = 0
+    chunk: List[Dict] = []
+    try:
+        for row in datagen.roster(employees, days, ROSTER_START, seed):
+            chunk.append(row)
+            if len(chunk) >= SEED_CHUNK:
+                total += sum(crud.bulk_upsert_employees(db, chunk))
+                db.commit()
+                chunk = []
+        total += sum(crud.bulk_upsert_employees(db, chunk))
+        db.commit()
+    finally:
+        db.close()
+    return total
+
+
+def _ranges(days: Sequence[date]) -> Dict[str, Dict[str, str]]:
+    last = days[-1]
+    week = days[max(0, len(days) - 5)]
+    month = days[max(0, len(days) - 22)]
+    return {
+        "day": {"start_date": last.isoformat(), "end_date": last.isoformat()},
+        "week": {"start_date": week.isoformat(), "end_date": last.isoformat()},
+        "month": {"start_date": month.isoformat(), "end_date": last.isoformat()},
+        "all": {},
+    }
+
+
+def run(args: argparse.Namespace) -> Dict:
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'obed-benchmark.db')}"
+    reset = args.reset or args.database_url is None
+    os.environ["DATABASE_URL"] = url
+    # Every export request should render; a cache hit would only measure the file download.
+    os.environ["EXPORT_CACHE_TTL"] = "0"
+    _prepare_database(url, reset)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy.engine import make_url
+
+    from app import webhooks
+    from app.main import WEBHOOK_SECRET, app
+    from app.crud import DEFAULT_PASSWORD, DEFAULT_USERNAME
+
+    scenarios = set(args.only.split(",")) if args.only else None
+    results: List[Dict] = []
+
+    def wanted(group: str) -> bool:
+        return scenarios is None or group in scenarios
+
+    def log(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    with TestClient(app) as client:
+        started = time.perf_counter()
+        seeded = _seed(args.employees, args.days, args.seed)
+        seed_seconds = time.perf_counter() - started
+        log(f"seeded {seeded} rows in {seed_seconds:.1f}s")
+
+        credentials = {"username": DEFAULT_USERNAME, "password": DEFAULT_PASSWORD}
+        token_response = client.post("/auth/login", json=credentials)
+        _check(token_response)
+        headers = {"Authorization": f"Bearer {token_response.json()['access_token']}"}
+
+        if wanted("login"):
+            results.append(
+                _measure("login", args.login_repeat, lambda: _check(client.post("/auth/login", json=credentials)))
+            )
+            log("login done")
+
+        ranges = _ranges(datagen.workdays(ROSTER_START, args.days))
+        if wanted("employees"):
+            for label, params in ranges.items():
+                results.append(
+                    _measure(
+                        f"employees.{label}",
+                        args.repeat,
+                        lambda params=params: _check(client.get("/employees", params=params, headers=headers)),
+                        params=params,
+                    )
+                )
+            log("employees done")
+
+        if wanted("export"):
+            params = ranges["month"]
+            for fmt in ("excel", "pdf"):
+                results.append(
+                    _measure(
+                        f"export.{fmt}",
+                        args.repeat,
+                        lambda fmt=fmt: _check(client.get(f"/employees/export/{fmt}", params=params, headers=headers)),
+                        params=params,
+                    )
+                )
+            log("export done")
+
+        if wanted("webhook"):
+            counter = iter(range(10**9))
+
+            def webhook_action() -> Dict:
+                index = next(counter)
+                return {
+                    "action": "add",
+                    "employee": {
+                        "full_name": f"Вебхук Тест {index}",
+                        "status": True,
+                        "date": (WRITE_START + timedelta(days=index % 365)).isoformat(),
+                    },
+                }
+
+            def post_singles() -> None:
+                for _ in range(args.webhook_count):
+                    _check(client.post("/webhook/employee", json={"secret": WEBHOOK_SECRET, **webhook_action()}))
+
+            def post_batch() -> None:
+                actions = [webhook_action() for _ in range(args.webhook_batch)]
+                _check(client.post("/webhook/employee/batch", json={"secret": WEBHOOK_SECRET, "actions": actions}))
+
+            mode = {"mode": webhooks.WEBHOOK_MODE}
+            results.append(_measure("webhook.single", 1, post_singles, args.webhook_count, mode))
+            results.append(_measure("webhook.batch", args.repeat, post_batch, args.webhook_batch, mode))
+            log("webhook done")
+
+        if wanted("import"):
+            for offset, size in enumerate(int(value) for value in args.import_sizes.split(",") if value.strip()):
+                start = WRITE_START.replace(year=WRITE_START.year + 1 + offset)
+                content = datagen.workbook(datagen.roster_rows(size, start, args.seed))
+
+                def upload(content: bytes = content) -> None:
+                    response = client.post(
+                        "/employees/import",
+                        files={"file": ("roster.xlsx", content, "application/octet-stream")},
+                        headers=headers,
+                    )
+                    _check(response)
+                    job_id = response.json()["job_id"]
+                    while True:
+                        status = client.get(f"/employees/import/{job_id}", headers=headers)
+                        _check(status)
+                        job = status.json()
+                        if job["status"] in ("completed", "failed"):
+                            break
+                        time.sleep(0.05)
+                    if job["status"] == "failed" or job["imported"] != size:
+                        raise RuntimeError(f"import {job['status']}: {job['imported']} of {size} rows, {job['error']}")
+
+                results.append(
+                    _measure(f"import.{size}", 1, upload, size, {"rows": size, "file_bytes": len(content)})
+                )
+                log(f"import {size} done")
+
+    parsed = make_url(url)
+    return {
+        "schema": SCHEMA,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "git": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": parsed.render_as_string(hide_password=True),
+            "dialect": parsed.get_backend_name(),
+        },
+        "dataset": {
+            "employees": args.employees,
+            "days": args.days,
+            "rows": seeded,
+            "seed": args.seed,
+            "seed_seconds": seed_seconds,
+        },
+        "results": results,
+    }
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.4f}"
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = {result["name"]: result for result in json.load(handle)["results"]}
+    with open(args.candidate, encoding="utf-8") as handle:
+        candidate = {result["name"]: result for result in json.load(handle)["results"]}
+
+    regressions = 0
+    print(f"{'benchmark':<24}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for name, result in candidate.items():
+        before = baseline.get(name, {}).get("median")
+        after = result.get("median")
+        if before is None or after is None:
+            print(f"{name:<24}{_seconds(before):>12}{_seconds(after):>12}{'n/a':>10}")
+            continue
+        change = (after - before) / before if before else 0.0
+        marker = ""
+        if change > args.threshold:
+            regressions += 1
+            marker = "  REGRESSION"
+        print(f"{name:<24}{_seconds(before):>12}{_seconds(after):>12}{change:>+10.1%}{marker}")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Бенчмарки сервиса обедов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Запустить бенчмарки и записать результаты в JSON")
+    run_parser.add_argument("--database-url", help="По умолчанию временная база SQLite, пересоздается при каждом запуске")
+    run_parser.add_argument("--reset", action="store_true", help="Удалить и создать схему заново перед запуском")
+    run_parser.add_argument("--employees", type=int, default=DEFAULT_EMPLOYEES)
+    run_parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Число рабочих дней в наборе данных")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--login-repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--import-sizes", default=DEFAULT_IMPORT_SIZES, help="Размеры файлов импорта через запятую")
+    run_parser.add_argument("--webhook-count", type=int, default=DEFAULT_WEBHOOK_COUNT)
+    run_parser.add_argument("--webhook-batch", type=int, default=DEFAULT_WEBHOOK_BATCH)
+    run_parser.add_argument("--only", help="Группы через запятую: login, employees, export, webhook, import")
+    run_parser.add_argument("--output", "-o", help="Файл для результатов (по умолчанию stdout)")
+
+    explain_parser = commands.add_parser(
+        "explain", help="Проверить, что основные запросы к attendance используют индексы (код 1, если нет)"
+    )
+    explain_parser.add_argument("--database-url", help="По умолчанию временная база SQLite")
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два файла результатов по медиане")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+    if args.command == "explain":
+        from .explain import explain
+
+        return explain(args)
+
+    report = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(report + "\n")
+    else:
+        print(report)
+    return 0
@@ -12,12 +12,26 @@ const api = axios.create({
   baseURL: import.meta.env.VITE_API_URL || resolveDefaultBaseURL()
 });
 
+// After a write the backend asks for primary-database reads for a few seconds (read-your-writes with replicas).
+let primaryUntil = 0;
+
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
   }
+  if (primaryUntil > Date.now() / 1000) {
+    config.headers['X-Primary-Until'] = String(primaryUntil);
+  }
   return config;
 });
 
+api.interceptors.response.use((response) => {
+  const marker = Number(response.headers['x-primary-until']);
+  if (marker) {
+    primaryUntil = marker;
+  }
+  return response;
+});
+
 export default api;
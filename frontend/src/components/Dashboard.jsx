@@ -1,16 +1,18 @@
-import { useCallback, useEffect, useMemo, useState } from 'react';
+import { useCallback, useEffect, useMemo, useRef, useState } from 'react';
 import {
   AppBar,
   Box,
   Button,
   Card,
   CardContent,
+  Checkbox,
   Dialog,
   DialogActions,
   DialogContent,
   DialogTitle,
   Drawer,
   FormControl,
+  FormControlLabel,
   Grid,
   IconButton,
   InputAdornment,
@@ -28,14 +30,17 @@ import {
   Add,
   CloudDownload,
   CloudUpload,
+  ContentCopy,
   DarkMode,
   Delete,
+  DoneAll,
   Edit,
   LightMode,
   Logout,
   MenuBook,
   PriceChange,
   Refresh,
+  RemoveDone,
   TableView
 } from '@mui/icons-material';
 import { DataGrid } from '@mui/x-data-grid';
@@ -45,6 +50,19 @@ import dayjs from 'dayjs';
 import api from '../api';
 import LogViewer from './LogViewer';
 
+const SORT_PARAMS = {
+  'date:desc': 'date_desc',
+  'date:asc': 'date_asc',
+  'full_name:asc': 'name_asc',
+  'full_name:desc': 'name_desc'
+};
+
+const sortParamFromModel = (sortModel) => {
+  const [item] = sortModel;
+  if (!item) return 'date_desc';
+  return SORT_PARAMS[`${item.field}:${item.sort}`] || 'date_desc';
+};
+
 const createDefaultEmployee = () => ({
   full_name: '',
   status: true,
@@ -52,6 +70,12 @@ const createDefaultEmployee = () => ({
   note: ''
 });
 
+const createDefaultCopy = () => ({
+  source: dayjs().subtract(1, 'day'),
+  target: dayjs(),
+  overwrite: false
+});
+
 const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
   const [employees, setEmployees] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -65,17 +89,40 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
   const [importing, setImporting] = useState(false);
   const [credentials, setCredentials] = useState({ username: '', password: '' });
   const [logsOpen, setLogsOpen] = useState(false);
+  const [paginationModel, setPaginationModel] = useState({ page: 0, pageSize: 10 });
+  const [sortModel, setSortModel] = useState([]);
+  const [nameFilter, setNameFilter] = useState('');
+  const [rowCount, setRowCount] = useState(0);
+  const [selectedIds, setSelectedIds] = useState([]);
+  const [copyDialogOpen, setCopyDialogOpen] = useState(false);
+  const [rosterCopy, setRosterCopy] = useState(createDefaultCopy());
+  const cursorsRef = useRef({ 0: null });
+
+  useEffect(() => {
+    cursorsRef.current = { 0: null };
+    setPaginationModel((prev) => (prev.page === 0 ? prev : { ...prev, page: 0 }));
+  }, [startDate, endDate, sortModel, nameFilter, paginationModel.pageSize]);
 
   const fetchEmployees = useCallback(
     async (rangeStart, rangeEnd) => {
       const effectiveStart = rangeStart === undefined ? startDate : rangeStart;
       const effectiveEnd = rangeEnd === undefined ? endDate : rangeEnd;
+      const { page, pageSize } = paginationModel;
+      const cursor = cursorsRef.current[page];
+      if (cursor === undefined) return;
       setLoading(true);
       try {
-        const params = {};
+        const params = { limit: pageSize, sort: sortParamFromModel(sortModel) };
+        if (cursor) params.cursor = cursor;
+        if (nameFilter.trim()) params.name = nameFilter.trim();
         if (effectiveStart) params.start_date = effectiveStart.format('YYYY-MM-DD');
         if (effectiveEnd) params.end_date = effectiveEnd.format('YYYY-MM-DD');
-        const { data } = await api.get('/employees', { params });
+        const { data } = await api.get('/employees/page', { params });
+        cursorsRef.current[page + 1] = data.next_cursor || undefined;
+        if (data.total_count !== null) {
+          setRowCount(data.total_count);
+          setTotals({ total_participants: data.total_participants, total_cost: data.total_cost });
+        }
         setEmployees(
           data.employees.map((item) => ({
             ...item,
@@ -83,7 +130,6 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
             date: dayjs(item.date).format('YYYY-MM-DD')
           }))
         );
-        setTotals({ total_participants: data.total_participants, total_cost: data.total_cost });
         setPrice(data.lunch_price);
         setEditedPrice(String(data.lunch_price));
       } catch (error) {
@@ -92,31 +138,52 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
         setLoading(false);
       }
     },
-    [endDate, startDate]
+    [endDate, startDate, paginationModel, sortModel, nameFilter]
   );
 
   useEffect(() => {
     fetchEmployees(startDate, endDate);
   }, [startDate, endDate, fetchEmployees]);
 
+  const fetchRef = useRef(fetchEmployees);
   useEffect(() => {
-    const handleVisibility = () => {
-      if (!document.hidden) {
-        fetchEmployees();
+    fetchRef.current = fetchEmployees;
+  }, [fetchEmployees]);
+
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    const source = new EventSource(`${api.defaults.baseURL}/events?token=${encodeURIComponent(token || '')}`);
+    let refetchTimer = null;
+    const scheduleRefetch = () => {
+      window.clearTimeout(refetchTimer);
+      refetchTimer = window.setTimeout(() => fetchRef.current(), 300);
+    };
+
+    source.onopen = scheduleRefetch;
+    source.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type === 'employee.updated') {
+        const updated = { ...event.employee, date: dayjs(event.employee.date).format('YYYY-MM-DD') };
+        setEmployees((rows) => rows.map((row) => (row.id === updated.id ? updated : row)));
+      } else if (event.type === 'employee.deleted') {
+        setEmployees((rows) => rows.filter((row) => row.id !== event.id));
+      } else if (event.type === 'settings.updated') {
+        setPrice(event.lunch_price);
+        setEditedPrice(String(event.lunch_price));
       }
+      // Totals and page membership are computed server-side, so the current page is re-read.
+      scheduleRefetch();
     };
-    const handleFocus = () => fetchEmployees();
-    const interval = window.setInterval(() => fetchEmployees(), 5000);
 
-    document.addEventListener('visibilitychange', handleVisibility);
+    const handleFocus = () => fetchRef.current();
     window.addEventListener('focus', handleFocus);
 
     return () => {
-      window.clearInterval(interval);
-      document.removeEventListener('visibilitychange', handleVisibility);
+      window.clearTimeout(refetchTimer);
       window.removeEventListener('focus', handleFocus);
+      source.close();
     };
-  }, [fetchEmployees]);
+  }, []);
 
   const handleAddEmployee = async () => {
     try {
@@ -132,6 +199,10 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
       fetchEmployees(startDate, endDate);
     } catch (error) {
       console.error('Не удалось добавить сотрудника', error);
+      // 409: the date falls into an archived (closed) month.
+      if (error.response?.status === 409) {
+        alert(error.response.data.detail);
+      }
     }
   };
 
@@ -157,6 +228,9 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
 
   const handleProcessRowUpdateError = useCallback((error) => {
     console.error('Ошибка обновления', error);
+    if (error.response?.status === 409) {
+      alert(error.response.data.detail);
+    }
   }, []);
 
   const handleDeleteEmployee = async (id) => {
@@ -169,6 +243,45 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
     }
   };
 
+  const handleBulkStatus = async (status) => {
+    try {
+      await api.post('/employees/bulk-update', { ids: selectedIds, status });
+      setSelectedIds([]);
+      fetchEmployees(startDate, endDate);
+    } catch (error) {
+      console.error('Не удалось обновить записи', error);
+    }
+  };
+
+  const handleCopyRoster = async () => {
+    try {
+      const { data } = await api.post('/employees/copy', {
+        source_date: rosterCopy.source.format('YYYY-MM-DD'),
+        target_date: rosterCopy.target.format('YYYY-MM-DD'),
+        overwrite: rosterCopy.overwrite
+      });
+      setCopyDialogOpen(false);
+      setRosterCopy(createDefaultCopy());
+      alert(`Скопировано: ${data.copied}, пропущено: ${data.skipped}`);
+      fetchEmployees(startDate, endDate);
+    } catch (error) {
+      console.error('Не удалось скопировать состав', error);
+      if (error.response?.status === 400 || error.response?.status === 409) {
+        alert(error.response.data.detail);
+      }
+    }
+  };
+
+  const waitForImport = async (jobId) => {
+    for (;;) {
+      const { data } = await api.get(`/employees/import/${jobId}`);
+      if (data.status === 'completed' || data.status === 'failed') {
+        return data;
+      }
+      await new Promise((resolve) => window.setTimeout(resolve, 1000));
+    }
+  };
+
   const handleImport = async (event) => {
     const file = event.target.files?.[0];
     if (!file) return;
@@ -176,9 +289,17 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
     try {
       const form = new FormData();
       form.append('file', file);
-      await api.post('/employees/import', form, {
+      const { data: job } = await api.post('/employees/import', form, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
+      const result = await waitForImport(job.job_id);
+      if (result.status === 'failed') {
+        alert(result.error || 'Импорт не выполнен');
+      } else if (result.rejected || result.updated) {
+        alert(
+          `Добавлено: ${result.created}, обновлено: ${result.updated}, отклонено строк: ${result.rejected}`
+        );
+      }
       fetchEmployees(startDate, endDate);
     } catch (error) {
       console.error('Ошибка импорта', error);
@@ -242,7 +363,7 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
 
   const columns = useMemo(
     () => [
-      { field: 'id', headerName: '№', width: 70 },
+      { field: 'id', headerName: '№', width: 70, sortable: false },
       { field: 'full_name', headerName: 'Ф.И.О', flex: 1, editable: true },
       {
         field: 'status',
@@ -254,6 +375,7 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
           { value: false, label: 'Не участвует' }
         ],
         editable: true,
+        sortable: false,
         valueFormatter: ({ value }) => (value ? 'Участвует' : 'Не участвует')
       },
       {
@@ -262,7 +384,7 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
         width: 160,
         editable: true
       },
-      { field: 'note', headerName: 'Примечание', flex: 1, editable: true },
+      { field: 'note', headerName: 'Примечание', flex: 1, editable: true, sortable: false },
       {
         field: 'actions',
         headerName: '',
@@ -378,16 +500,38 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
                     value={endDate}
                     onChange={(value) => setEndDate(value)}
                   />
+                  <TextField
+                    label="Поиск по Ф.И.О"
+                    value={nameFilter}
+                    onChange={(e) => setNameFilter(e.target.value)}
+                  />
                   <Tooltip title="Обновить">
                     <IconButton onClick={() => fetchEmployees(startDate, endDate)}>
                       <Refresh />
                     </IconButton>
                   </Tooltip>
+                  <Tooltip title="Отметить участие выбранных">
+                    <span>
+                      <IconButton disabled={!selectedIds.length} onClick={() => handleBulkStatus(true)}>
+                        <DoneAll />
+                      </IconButton>
+                    </span>
+                  </Tooltip>
+                  <Tooltip title="Снять участие выбранных">
+                    <span>
+                      <IconButton disabled={!selectedIds.length} onClick={() => handleBulkStatus(false)}>
+                        <RemoveDone />
+                      </IconButton>
+                    </span>
+                  </Tooltip>
                 </Stack>
                 <Stack direction={{ xs: 'column', sm: 'row' }} spacing={1} alignItems="center">
                   <Button startIcon={<Add />} variant="contained" onClick={() => setAddDialogOpen(true)}>
                     Добавить
                   </Button>
+                  <Button startIcon={<ContentCopy />} variant="outlined" onClick={() => setCopyDialogOpen(true)}>
+                    Копировать день
+                  </Button>
                   <Button component="label" startIcon={<CloudUpload />} variant="outlined" disabled={importing}>
                     Импорт Excel
                     <input type="file" hidden accept=".xlsx,.xls" onChange={handleImport} />
@@ -414,10 +558,19 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
               <DataGrid
                 rows={employees}
                 columns={columns}
+                checkboxSelection
                 disableRowSelectionOnClick
+                rowSelectionModel={selectedIds}
+                onRowSelectionModelChange={setSelectedIds}
                 loading={loading}
                 pageSizeOptions={[10, 20, 50]}
-                initialState={{ pagination: { paginationModel: { pageSize: 10, page: 0 } } }}
+                paginationMode="server"
+                sortingMode="server"
+                rowCount={rowCount}
+                paginationModel={paginationModel}
+                onPaginationModelChange={setPaginationModel}
+                sortModel={sortModel}
+                onSortModelChange={setSortModel}
                 processRowUpdate={processRowUpdate}
                 onProcessRowUpdateError={handleProcessRowUpdateError}
                 editMode="row"
@@ -526,6 +679,39 @@ const Dashboard = ({ onLogout, themeMode, onToggleTheme }) => {
         </DialogActions>
       </Dialog>
 
+      <Dialog open={copyDialogOpen} onClose={() => setCopyDialogOpen(false)} fullWidth maxWidth="xs">
+        <DialogTitle>Копировать состав на другой день</DialogTitle>
+        <DialogContent>
+          <Stack spacing={2} mt={1}>
+            <DatePicker
+              label="Откуда"
+              value={rosterCopy.source}
+              onChange={(value) => value && setRosterCopy((prev) => ({ ...prev, source: value }))}
+            />
+            <DatePicker
+              label="Куда"
+              value={rosterCopy.target}
+              onChange={(value) => value && setRosterCopy((prev) => ({ ...prev, target: value }))}
+            />
+            <FormControlLabel
+              control={
+                <Checkbox
+                  checked={rosterCopy.overwrite}
+                  onChange={(e) => setRosterCopy((prev) => ({ ...prev, overwrite: e.target.checked }))}
+                />
+              }
+              label="Перезаписать существующие записи"
+            />
+          </Stack>
+        </DialogContent>
+        <DialogActions>
+          <Button onClick={() => setCopyDialogOpen(false)}>Отмена</Button>
+          <Button onClick={handleCopyRoster} variant="contained">
+            Копировать
+          </Button>
+        </DialogActions>
+      </Dialog>
+
       <Drawer anchor="right" open={logsOpen} onClose={() => setLogsOpen(false)}>
         <LogViewer />
       </Drawer>
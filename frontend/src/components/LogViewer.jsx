@@ -1,44 +1,108 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useState } from 'react';
 import {
   Box,
+  Button,
   Divider,
+  FormControlLabel,
   IconButton,
   List,
   ListItem,
   ListItemText,
+  MenuItem,
+  Switch,
+  TextField,
   Typography
 } from '@mui/material';
 import { Refresh } from '@mui/icons-material';
 import api from '../api';
 
+const LEVELS = ['', 'INFO', 'WARN', 'ERROR'];
+const MAX_LIVE_ENTRIES = 500;
+
 const LogViewer = () => {
   const [logs, setLogs] = useState([]);
+  const [cursor, setCursor] = useState(null);
+  const [level, setLevel] = useState('');
+  const [search, setSearch] = useState('');
+  const [live, setLive] = useState(false);
 
-  const loadLogs = async () => {
-    try {
-      const { data } = await api.get('/logs');
-      setLogs(data.entries);
-    } catch (error) {
-      console.error('Не удалось получить логи', error);
-    }
-  };
+  const loadLogs = useCallback(
+    async (before = null) => {
+      try {
+        const params = { limit: 100 };
+        if (level) params.level = level;
+        if (search.trim()) params.q = search.trim();
+        if (before) params.cursor = before;
+        const { data } = await api.get('/logs', { params });
+        setLogs((current) => (before ? [...current, ...data.entries] : data.entries));
+        setCursor(data.next_cursor);
+      } catch (error) {
+        console.error('Не удалось получить логи', error);
+      }
+    },
+    [level, search]
+  );
 
   useEffect(() => {
-    loadLogs();
-  }, []);
+    const timer = window.setTimeout(() => loadLogs(), 300);
+    return () => window.clearTimeout(timer);
+  }, [loadLogs]);
+
+  useEffect(() => {
+    if (!live) return undefined;
+    const token = localStorage.getItem('token');
+    const source = new EventSource(`${api.defaults.baseURL}/logs/stream?token=${encodeURIComponent(token || '')}`);
+    source.onmessage = (message) => {
+      const entry = JSON.parse(message.data);
+      if (level && entry.level !== level) return;
+      if (search.trim() && !entry.message.toLowerCase().includes(search.trim().toLowerCase())) return;
+      // A late entry from another worker can carry a lower id than ones already shown; keep newest first.
+      setLogs((current) => [entry, ...current].sort((a, b) => b.id - a.id).slice(0, MAX_LIVE_ENTRIES));
+    };
+    return () => source.close();
+  }, [live, level, search]);
 
   return (
     <Box p={2} width={360} role="presentation">
       <Box display="flex" alignItems="center" justifyContent="space-between" mb={1}>
         <Typography variant="h6">Логи</Typography>
-        <IconButton onClick={loadLogs} size="small">
-          <Refresh fontSize="small" />
-        </IconButton>
+        <Box display="flex" alignItems="center">
+          <FormControlLabel
+            control={<Switch size="small" checked={live} onChange={(event) => setLive(event.target.checked)} />}
+            label="Live"
+          />
+          <IconButton onClick={() => loadLogs()} size="small">
+            <Refresh fontSize="small" />
+          </IconButton>
+        </Box>
+      </Box>
+      <Box display="flex" gap={1} mb={1}>
+        <TextField
+          select
+          size="small"
+          label="Уровень"
+          value={level}
+          onChange={(event) => setLevel(event.target.value)}
+          sx={{ minWidth: 110 }}
+        >
+          {LEVELS.map((option) => (
+            <MenuItem key={option || 'all'} value={option}>
+              {option || 'Все'}
+            </MenuItem>
+          ))}
+        </TextField>
+        <TextField
+          size="small"
+          label="Поиск"
+          value={search}
+          onChange={(event) => setSearch(event.target.value)}
+          fullWidth
+        />
       </Box>
       <Divider />
       <List dense sx={{ maxHeight: 480, overflowY: 'auto' }}>
         {logs.map((log, idx) => (
-          <ListItem key={`${log.timestamp}-${idx}`} alignItems="flex-start">
+          <ListItem key={log.id ?? `${log.timestamp}-${idx}`} alignItems="flex-start">
             <ListItemText
               primary={`${new Date(log.timestamp).toLocaleString()} • ${log.level}`}
               secondary={log.message}
@@ -51,6 +115,11 @@ const LogViewer = () => {
           </Typography>
         )}
       </List>
+      {cursor && (
+        <Button size="small" fullWidth onClick={() => loadLogs(cursor)}>
+          Показать еще
+        </Button>
+      )}
     </Box>
   );
 };